@@ -1,21 +1,36 @@
 import os
 import sys
+import threading
 from datetime import datetime, timedelta
 import math
 import json
+from collections import OrderedDict
+from html import escape
+from sqlite3 import OperationalError
 
 # TODO: pare this down to what we actually need
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
-from PyQt5.QtWebKitWidgets import QWebView
 from PyQt5.QtPrintSupport import QPrintDialog
 
-from inventory import Measurement, InventoryDB, InventoryItem, Report
+from inventory import (Measurement, InventoryDB, InventoryItem, Report,
+                       item_matches)
 from ReportManager import ReportManagerDialog
+from export import export_report, format_for
 
 app_name = "The Quartermaster"
 
+# how often to look for changes made to the file by other programs, in
+# milliseconds
+poll_interval = 2000
+
+# how many rows of a report to show before asking to load more
+report_row_limit = 1000
+
+# how many rows of the inventory table to keep formatted for display
+display_cache_rows = 2000
+
 # set up the QT application properties
 qt_app = QApplication(sys.argv)
 qt_app.setOrganizationName("Jason R. Fruit")
@@ -24,28 +39,551 @@ qt_app.setApplicationName(app_name)
 # use a human-readable settings filetype
 QSettings.setDefaultFormat(QSettings.IniFormat)
 
+class FilterSignals(QObject):
+    """Signals from a FilterTask; rows carries the task's generation, a
+    batch of items, and whether it is the last batch"""
+    rows = pyqtSignal(int, list, bool)
+
+class FilterTask(QRunnable):
+    """Runs a filter query on a worker thread on one of the database's
+    read-only connections, or narrows the items of an earlier result,
+    and delivers the matching items in batches"""
+    def __init__(self, generation, db, text, record_type, sort,
+                 descending, base=None, batch_size=500):
+        QRunnable.__init__(self)
+
+        self.generation = generation
+        self.db = db
+        self.text = text
+        self.record_type = record_type
+        self.sort = sort
+        self.descending = descending
+        self.base = base # items to narrow instead of querying
+        self.batch_size = batch_size
+
+        self.signals = FilterSignals()
+        self.cancelled = False
+
+        # the connection borrowed while the query runs; cancel() must not
+        # interrupt it once it has gone back to the pool
+        self.conn = None
+        self._conn_lock = threading.Lock()
+
+    def cancel(self):
+        """Stop the task as soon as possible; nothing more is delivered"""
+        self.cancelled = True
+
+        # stop a query that is still running
+        with self._conn_lock:
+            if self.conn:
+                self.conn.interrupt()
+
+    def run(self):
+        try:
+            if self.base is not None:
+                self._deliver(item
+                              for item in self.base
+                              if item_matches(item, self.text))
+            else:
+                with self.db.read_pool.connection() as conn:
+                    with self._conn_lock:
+                        self.conn = conn
+
+                    items = self.db.search(self.text,
+                                           self.record_type,
+                                           self.sort,
+                                           self.descending,
+                                           self.batch_size,
+                                           conn)
+                    try:
+                        self._deliver(items)
+                    finally:
+                        # finish with the connection before giving it back
+                        items.close()
+                        with self._conn_lock:
+                            self.conn = None
+        except OperationalError: # interrupted by cancel()
+            pass
+
+    def _deliver(self, source):
+        """Send the items of <source> in batches"""
+        batch = []
+        for item in source:
+            if self.cancelled:
+                return
+
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self.signals.rows.emit(self.generation, batch, False)
+                batch = []
+
+        if not self.cancelled:
+            self.signals.rows.emit(self.generation, batch, True)
+
+class ReportSignals(QObject):
+    """Signals from a ReportTask; rows carries the task's generation,
+    the column names, a batch of rows, whether it is the last batch,
+    and whether the row limit left more rows unread; failed carries the
+    generation and an error message"""
+    rows = pyqtSignal(int, list, list, bool, bool)
+    failed = pyqtSignal(int, str)
+
+class ReportTask(QRunnable):
+    """Runs a report on a worker thread, on one of the database's
+    read-only connections, and delivers its rows in batches"""
+    def __init__(self, generation, db, sql, offset=0, limit=None,
+                 batch_size=500):
+        QRunnable.__init__(self)
+
+        self.generation = generation
+        self.db = db
+        self.sql = sql
+        self.offset = offset
+        self.limit = limit
+        self.batch_size = batch_size
+
+        self.signals = ReportSignals()
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop the task as soon as possible; nothing more is delivered"""
+        self.cancelled = True
+
+    def _isCancelled(self):
+        return self.cancelled
+
+    def run(self):
+        # read one row past the limit to find out whether there are more
+        if self.limit is None:
+            limit = None
+        else:
+            limit = self.limit + 1
+
+        count = 0
+        more = False
+        try:
+            batches = self.db.iter_report(self.sql,
+                                          self.batch_size,
+                                          limit,
+                                          self.offset,
+                                          self._isCancelled)
+            for columns, rows in batches:
+                if self.cancelled:
+                    return
+
+                if self.limit is not None and count + len(rows) > self.limit:
+                    rows = rows[:self.limit - count]
+                    more = True
+
+                count += len(rows)
+                self.signals.rows.emit(self.generation, columns, rows,
+                                       False, False)
+
+                # the database goes on to read the rest of the report
+                # into its cache, which the dialog needn't wait for
+                if more:
+                    self.signals.rows.emit(self.generation, columns, [],
+                                           True, True)
+
+            if not self.cancelled and not more:
+                self.signals.rows.emit(self.generation, columns, [],
+                                       True, False)
+        except Exception as e:
+            # once the rows are delivered, failing to cache the rest
+            # is no concern of the dialog's
+            if not self.cancelled and not more:
+                self.signals.failed.emit(self.generation, str(e))
+
+class ExportSignals(QObject):
+    """Signals from an ExportTask; finished carries the number of rows
+    written, failed an error message"""
+    finished = pyqtSignal(int)
+    failed = pyqtSignal(str)
+
+class ExportTask(QRunnable):
+    """Writes all the results of a report to a file on a worker thread"""
+    def __init__(self, db, sql, filename):
+        QRunnable.__init__(self)
+
+        self.db = db
+        self.sql = sql
+        self.filename = filename
+
+        self.signals = ExportSignals()
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _isCancelled(self):
+        return self.cancelled
+
+    def run(self):
+        try:
+            count = export_report(self.db, self.sql, self.filename,
+                                  cancelled=self._isCancelled)
+        except Exception as e:
+            if not self.cancelled:
+                self.signals.failed.emit(str(e))
+                return
+
+        if self.cancelled:
+            # don't leave half a file behind
+            try:
+                os.remove(self.filename)
+            except OSError:
+                pass
+        else:
+            self.signals.finished.emit(count)
+
+def _no_format(value):
+    return value
+
+def _format_measurement(value):
+    return None if value is None else value.to_string()
+
+def _format_date(value):
+    return None if value is None else value.strftime("%B %d, %Y")
+
+# how InventoryListModel shows the attributes that aren't shown as they
+# are
+item_formats = {"amount": _format_measurement,
+                "life": _format_measurement,
+                "purchase_date": _format_date,
+                "expiration_date": _format_date}
+
 class InventoryListModel(QAbstractTableModel):
-    """A model to feed a table widget of inventory items"""
-    def __init__(self, parent, items, *args):
+    """A model to feed a table widget of inventory items of one record
+    type; the database does the filtering and sorting.  Unfiltered rows
+    are read a page at a time as the table scrolls; filtered rows are
+    found on a worker thread and added as they arrive"""
+    def __init__(self, parent, db, record_type, *args, page_size=200):
         QAbstractTableModel.__init__(self, parent, *args)
         
         # edit this if column definitions are changed
         self.item_attribs = ['id', 'condition', 'description',
                              'amount', 'life', 'purchase_date',
                              'expiration_date']
+        self._formats = [(attrib, item_formats.get(attrib, _no_format))
+                         for attrib in self.item_attribs]
+
+        # the text of the rows shown most recently, by item ID
+        self._display = OrderedDict()
+
+        self.db = db
+        self.record_type = record_type
+        self.page_size = page_size
+
+        # the current query
+        self.filter = ""
+        self.sort_attrib = None
+        self.descending = False
+
+        # the running filter task, and a count of queries so that late
+        # results from stale ones can be ignored
+        self._task = None
+        self._generation = 0
+
+        # the filter that self.items holds the complete result of, if
+        # any; a longer filter can narrow it without a query
+        self._complete_filter = None
+
+        self.items = [] # the rows read so far
+        self._loaded = {} # the same rows by item ID
+        self._query()
+
+        # keep up with changes rather than reading everything again
+        self.db.add_listener(self._dbChanged)
+
+    def _query(self):
+        """Start reading the rows of the current query from the top"""
+
+        self.cancel()
+        self._generation += 1
+        self._display = OrderedDict()
+
+        # a filter extending one whose full result we have can only
+        # match a subset of it
+        base = None
+        if (self._complete_filter is not None and
+            self.filter.startswith(self._complete_filter)):
+            base = self.items
+
+        self._complete_filter = None
+        self.items = []
+        self._loaded = {}
+
+        if self.filter.strip() == "":
+            self._exhausted = False
+
+            # read the first page now so the table has something to
+            # show and size its columns by
+            self.items = self._readPage()
+            self._loaded = {item.id: item for item in self.items}
+        else:
+            self._exhausted = True
+
+            self._task = FilterTask(self._generation,
+                                    self.db,
+                                    self.filter,
+                                    self.record_type,
+                                    self.sort_attrib,
+                                    self.descending,
+                                    base,
+                                    self.page_size)
+            self._task.signals.rows.connect(self._rowsReady)
+            QThreadPool.globalInstance().start(self._task)
+
+    def cancel(self):
+        """Stop any filter still running for this model"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def close(self):
+        """Stop filtering and following changes; the model is no longer
+        needed"""
+        self.cancel()
+        self.db.remove_listener(self._dbChanged)
+
+    def _requery(self):
+        self.beginResetModel()
+
+        # the rows have changed, so the old result can't be narrowed
+        self._complete_filter = None
+        self._query()
+        self.endResetModel()
+
+    def _dbChanged(self, event):
+        """Bring the rows up to date after a change to the database,
+        touching only the rows changed"""
+
+        # another program changed the file; what changed is unknown
+        if event.action == "external":
+            self._requery()
+            return
+
+        if event.record_type != self.record_type:
+            return
+
+        # a running filter may or may not see the change, and a big one
+        # is quicker to read again
+        if self._task or len(event.ids) > self.page_size:
+            self._requery()
+            return
+
+        if event.action == "delete":
+            for id in event.ids:
+                row = self._rowOf(id)
+                self._display.pop(id, None)
+                if row is not None:
+                    self.beginRemoveRows(QModelIndex(), row, row)
+                    del self.items[row]
+                    del self._loaded[id]
+                    self.endRemoveRows()
+        else:
+            for item in self.db.get_items(event.ids, self.record_type):
+                if event.action == "update":
+                    self._place(item, self._rowOf(item.id))
+                else:
+                    self._place(item, None)
+
+    def _rowOf(self, id):
+        """Return the row showing the item with ID <id>, if it is loaded"""
+
+        item = self._loaded.get(id)
+        if item is None:
+            return None
+
+        # the rows are in order, so look the item up by its sort key,
+        # unless the database ranked them
+        if not (self.filter.strip() != "" and self.sort_attrib is None):
+            lo, hi = 0, len(self.items)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._before(self.items[mid], item):
+                    lo = mid + 1
+                else:
+                    hi = mid
+
+            if lo < len(self.items) and self.items[lo] is item:
+                return lo
+
+        # an item changed in place no longer sorts where its row is
+        for row, loaded in enumerate(self.items):
+            if loaded is item:
+                return row
+        return None
+
+    def _sortKey(self, item):
+        """Return a key that orders items as the current query does"""
+
+        def nullable(value):
+            # SQLite puts nulls first
+            return (0,) if value is None else (1, value)
+
+        attrib = self.sort_attrib
+        if attrib is None:
+            return (nullable(item.purchase_date), item.id)
+        elif attrib in ("amount", "life"):
+            measurement = getattr(item, attrib)
+            return (measurement.base_quantity(self.db.conversions) +
+                    (item.id,))
+        elif attrib == "condition":
+            return (item.condition, item.description, item.id)
+        elif attrib == "id":
+            return (item.id,)
+        else:
+            return (nullable(getattr(item, attrib)), item.id)
+
+    def _descending(self):
+        # with no column chosen, the newest purchases come first
+        return self.descending or self.sort_attrib is None
+
+    def _before(self, a, b):
+        """Return whether item <a> comes before item <b>"""
+        if self._descending():
+            return self._sortKey(a) > self._sortKey(b)
+        else:
+            return self._sortKey(a) < self._sortKey(b)
+
+    def _position(self, item):
+        """Return the row a new item belongs at, or None if it comes
+        after the rows loaded so far"""
+
+        # full-text matches are ranked by the database
+        if self.filter.strip() != "" and self.sort_attrib is None:
+            return len(self.items) if self._exhausted else None
+
+        lo, hi = 0, len(self.items)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._before(item, self.items[mid]):
+                hi = mid
+            else:
+                lo = mid + 1
+
+        if lo == len(self.items) and not self._exhausted:
+            return None
+        return lo
+
+    def _place(self, item, row):
+        """Show a new or changed item, which was in <row> if not None"""
+
+        matches = item_matches(item, self.filter)
+        self._display.pop(item.id, None)
+
+        if row is not None:
+            # changed in place
+            if matches and self._fits(item, row):
+                self.items[row] = item
+                self._loaded[item.id] = item
+                self.dataChanged.emit(
+                    self.index(row, 0),
+                    self.index(row, len(self.item_attribs) - 1))
+                return
+
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.items[row]
+            del self._loaded[item.id]
+            self.endRemoveRows()
+
+        if not matches:
+            return
+
+        row = self._position(item)
+        if row is not None:
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.items.insert(row, item)
+            self._loaded[item.id] = item
+            self.endInsertRows()
+
+    def _fits(self, item, row):
+        """Return whether <item> can stay in <row> without breaking the
+        order"""
+
+        if self.filter.strip() != "" and self.sort_attrib is None:
+            return True
+
+        # the last row may belong among the rows not read yet, and is
+        # where the next page starts from
+        if row == len(self.items) - 1:
+            return self._exhausted and (
+                row == 0 or not self._before(item, self.items[row - 1]))
+
+        return ((row == 0 or
+                 not self._before(item, self.items[row - 1])) and
+                not self._before(self.items[row + 1], item))
+
+    def _rowsReady(self, generation, items, done):
+        """Add a batch of rows delivered by a FilterTask"""
+
+        # drop results of a superseded query
+        if generation != self._generation:
+            return
+
+        if items:
+            first = len(self.items)
+            self.beginInsertRows(QModelIndex(),
+                                 first,
+                                 first + len(items) - 1)
+            self.items.extend(items)
+            self._loaded.update((item.id, item) for item in items)
+            self.endInsertRows()
+
+        if done:
+            self._task = None
+            self._complete_filter = self.filter
+
+    def _readPage(self):
+        """Return the next page of rows from the current query"""
+
+        # each page is a query of its own, so the file isn't kept locked
+        # while the table waits to be scrolled; read one row more than a
+        # page to find out whether there are more
+        try:
+            page = self.db.inventory_page(self.record_type,
+                                          self.sort_attrib,
+                                          self.descending,
+                                          self.items[-1].id
+                                          if self.items else None,
+                                          self.page_size + 1)
+        except KeyError:
+            # another program deleted the last row; what else it changed
+            # is unknown
+            self._exhausted = True
+            QTimer.singleShot(0, self._requery)
+            return []
+
+        if len(page) > self.page_size:
+            del page[self.page_size:]
+        else:
+            self._exhausted = True
+            self._complete_filter = self.filter
+
+        return page
         
-        self.base_items = items # always contains all items
-        self.items = items # sometimes reduced by filtering
-        
+    def canFetchMore(self, parent):
+        return not self._exhausted
+
+    def fetchMore(self, parent):
+        page = self._readPage()
+
+        if page:
+            first = len(self.items)
+            self.beginInsertRows(QModelIndex(),
+                                 first,
+                                 first + len(page) - 1)
+            self.items.extend(page)
+            self._loaded.update((item.id, item) for item in page)
+            self.endInsertRows()
+
     def rowCount(self, parent):
         return len(self.items)
     def columnCount(self, parent):
         return len(self.item_attribs)
     def data(self, index, role):
 
-        # get the attribute name for the column number
-        attrib = self.item_attribs[index.column()]
-
         # not sure why the index object would be invalid, but the
         # whole thing died when I took this out!
         if not index.isValid():
@@ -54,54 +592,33 @@ class InventoryListModel(QAbstractTableModel):
                                      # like
             return None
 
-        # get the attribute value from the row's item
-        val = getattr(self.items[index.row()],
-                      attrib)
-        
-        try:
-            val = val.to_string() # if it has a to_string() method,
-            # convert it to a string
-        except:
-            try:
-                # if it's a date, format it nicely
-                val = val.strftime("%B %d, %Y")
-            except:
-                pass # it's already good
-            
-        return val
-
-    def set_filter(self, filter):
-
-        # let the control know it's about to see some changes around
-        # here
-        self.layoutAboutToBeChanged.emit()
-        
-        def item_contains(item, words):
-            """returns True if the item contains all the words in the condition or
-            description (case-insensitive)
-
-            """
-            retval = True
+        # a row is formatted the first time it is shown, and kept
+        # until its item changes or it is one of the least recently
+        # shown past display_cache_rows
+        item = self.items[index.row()]
+        text = self._display.get(item.id)
+        if text is None:
+            text = tuple(show(getattr(item, attrib))
+                         for attrib, show in self._formats)
+            self._display[item.id] = text
+            if len(self._display) > display_cache_rows:
+                self._display.popitem(last=False)
+        else:
+            self._display.move_to_end(item.id)
 
-            for word in words:
-                if ((not word in item.condition.lower()) and
-                    (not word in item.description.lower())):
-                    retval = False
+        return text[index.column()]
 
-            return retval
-        
-        if filter.strip() == "": # don't loop if there's no filter
-            self.items = self.base_items
-        else:
-            words = filter.lower().split(" ")
+    def set_filter(self, filter):
+        """Show only the items whose condition or description has a word
+        starting with each of the words in <filter> (case-insensitive)"""
 
-            # apply the filter
-            self.items = [item
-                          for item in self.base_items
-                          if item_contains(item, words)]
+        if filter == self.filter:
+            return
 
-        # let the control know it's time to update
-        self.layoutChanged.emit()
+        self.beginResetModel()
+        self.filter = filter
+        self._query()
+        self.endResetModel()
         
     def headerData(self, col, orientation, role):
         if orientation == Qt.Horizontal and role == Qt.DisplayRole:
@@ -113,21 +630,120 @@ class InventoryListModel(QAbstractTableModel):
     
     def sort(self, col, order):
 
-        # notify the control changes will occur
-        self.layoutAboutToBeChanged.emit()
+        self.beginResetModel()
+        self.sort_attrib = self.item_attribs[col]
+        self.descending = (order == Qt.DescendingOrder)
+
+        # a different order can't reuse the old result
+        self._complete_filter = None
+        self._query()
+        self.endResetModel()
+
+def sql_sort_key(value):
+    """Order values as SQLite does: nulls, then numbers, then text, then
+    blobs"""
+    if value is None:
+        return (0, 0)
+    elif isinstance(value, (int, float)):
+        return (1, value)
+    elif isinstance(value, str):
+        return (2, value)
+    else:
+        return (3, value)
+
+class ReportModel(QAbstractTableModel):
+    """A model to feed a table widget the rows of a report as they
+    arrive; only the cells on screen are ever turned into text"""
+    def __init__(self, parent, columns, *args):
+        QAbstractTableModel.__init__(self, parent, *args)
+
+        self.columns = columns
+
+        self.loaded = [] # the rows in the order the report gave them
+        self.rows = [] # the same, in the order shown
+
+        # the column sorted on, if any, and whether descending
+        self.sort_col = -1
+        self.descending = False
 
-        # get the attribute name to sort by
-        attrib = self.item_attribs[col]
+    def add_rows(self, rows):
+        """Add a batch of rows to the end, or into place if sorted"""
+        self.loaded.extend(rows)
 
-        # do the sort, and reverse if needed
-        self.items = sorted(self.items,
-                            key=lambda s: getattr(s, attrib))
-        if order == Qt.DescendingOrder:
-            self.items.reverse()
+        if self.sort_col < 0:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(),
+                                 first,
+                                 first + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+        else:
+            # the sorted rows and the new ones are two runs, which
+            # sort() merges quickly
+            self.layoutAboutToBeChanged.emit()
+            self.rows.extend(rows)
+            self._sortRows()
+            self.layoutChanged.emit()
+
+    def _sortRows(self):
+        col = self.sort_col
+        self.rows.sort(key=lambda row: sql_sort_key(row[col]),
+                       reverse=self.descending)
+
+    def rowCount(self, parent):
+        return len(self.rows)
+    def columnCount(self, parent):
+        return len(self.columns)
+    def data(self, index, role):
+        if not index.isValid():
+            return None
+
+        val = self.rows[index.row()][index.column()]
+
+        if role == Qt.DisplayRole:
+            if isinstance(val, bytes):
+                return "<%d bytes>" % len(val)
+            return val
+        elif role == Qt.TextAlignmentRole:
+            if isinstance(val, (int, float)):
+                return Qt.AlignRight | Qt.AlignVCenter
+
+        return None
 
-        # tell control to refresh
+    def headerData(self, col, orientation, role):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.columns[col]
+
+        return None
+
+    def sort(self, col, order):
+        self.layoutAboutToBeChanged.emit()
+        self.sort_col = col
+        self.descending = (order == Qt.DescendingOrder)
+
+        # no column means the report's own order
+        if col < 0:
+            self.rows = list(self.loaded)
+        else:
+            self._sortRows()
         self.layoutChanged.emit()
 
+    def text(self, indexes):
+        """Return the values at <indexes> as tab-separated lines"""
+        cells = {}
+        for index in indexes:
+            val = self.rows[index.row()][index.column()]
+            cells.setdefault(index.row(), {})[index.column()] = (
+                "" if val is None else str(val))
+
+        lines = []
+        for row in sorted(cells):
+            cols = cells[row]
+            lines.append("\t".join(cols.get(col, "")
+                                   for col in range(min(cols),
+                                                    max(cols) + 1)))
+        return "\n".join(lines)
+
 class MultSpinner(QHBoxLayout):
     """An HBox with a label and a numeric spinner control whose value is
     multiplied by <multiplier>"""
@@ -202,7 +818,7 @@ class RationMultiplierDialog(QDialog):
 
 class InventoryItemDialog(QDialog):
     """A dialog to add and edit inventory items"""
-    def __init__(self, parent, goals, amounts, item=None):
+    def __init__(self, parent, catalog, amounts, item=None):
         QDialog.__init__(self, parent)
 
         if item:
@@ -214,7 +830,8 @@ class InventoryItemDialog(QDialog):
 
         self.setMinimumWidth(400)
 
-        self.goals = goals
+        self.catalog = catalog
+        self.goals = catalog.goals
         self.amounts = amounts
 
         self._addControls()
@@ -226,14 +843,6 @@ class InventoryItemDialog(QDialog):
 
         self.canceled = True
 
-    def format_goal(self, goal):
-        if goal.condition == "":
-            dsc =  goal.description
-        else:
-            dsc = "%s (%s)" % (goal.description, goal.condition)
-
-        return dsc + ", " + goal.amount.to_string()
-
     def _addControls(self):
 
         self.layout = QVBoxLayout()
@@ -244,13 +853,18 @@ class InventoryItemDialog(QDialog):
         self.goal_combo = QComboBox()
 
             
-        self.goal_combo.addItems([self.format_goal(goal)
-                                  for goal in self.goals])
+        self.goal_combo.addItems(self.catalog.labels)
 
         self.goal_hbox.addWidget(self.goal_label)
         self.goal_hbox.addWidget(self.goal_combo)
 
         self.layout.addLayout(self.goal_hbox)
+
+        # how much of the selected goal is already on hand
+        self.coverage_label = QLabel()
+        self.layout.addWidget(self.coverage_label)
+        self.goal_combo.currentIndexChanged.connect(self._showCoverage)
+        self._showCoverage()
         
         # amount (number and unit)
         self.amount_hbox = QHBoxLayout(self)
@@ -281,11 +895,24 @@ class InventoryItemDialog(QDialog):
         self.button_hbox.addWidget(self.cancel_btn)
         self.layout.addLayout(self.button_hbox)
 
+    def _showCoverage(self, *args):
+        if not self.goals:
+            return
+
+        goal = self.goals[self.goal_combo.currentIndex()]
+        on_hand, expiration = self.parent().db.goal_coverage(goal)
+
+        text = "On hand: %s of %s" % (on_hand.to_string(),
+                                      goal.amount.to_string())
+        if expiration:
+            text += ", first expiring %s" % expiration.strftime("%B %d, %Y")
+
+        self.coverage_label.setText(text)
+
     def _syncControlsToItem(self, *args):
-        for i in range(self.goal_combo.count()):
-            if (self.format_goal(self.item) ==
-                self.goal_combo.itemText(i)):
-                self.goal_combo.setCurrentIndex(i)
+        i = self.catalog.find(self.item)
+        if i is not None:
+            self.goal_combo.setCurrentIndex(i)
 
         self.amount_text.setText(str(self.item.amount.number))
         self.amount_combo.setCurrentIndex(
@@ -480,19 +1107,46 @@ class GoalDialog(QDialog):
         
 
 class ReportDialog(QDialog):
-    """A dialog to display a table of data"""
-    def __init__(self, parent, title, columns, data):
+    """A dialog to display the results of a report in a table, filled
+    in as the rows arrive from a worker thread, <row_limit> rows at a
+    time if given"""
+    def __init__(self, parent, title, db, sql, row_limit=None):
         QDialog.__init__(self, parent)
 
+        self.title = title
+        self.db = db
+        self.sql = sql
+        self.row_limit = row_limit
+
+        # the running task, and a count of tasks so that late results
+        # from cancelled ones can be ignored
+        self._task = None
+        self._generation = 0
+
+        # a finished task that may still be reading the rest of the
+        # report into the database's cache
+        self._caching_task = None
+        self.row_count = 0
+
         self.layout = QVBoxLayout()
         self.setLayout(self.layout)
         
         self.setMinimumWidth(400)
         self.setWindowTitle(title)
 
-        self.webView = QWebView()
+        self.table = QTableView()
+        self.table.setSelectionBehavior(QAbstractItemView.SelectItems)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.layout.addWidget(self.table)
+
+        self.copy_shortcut = QShortcut(QKeySequence.Copy, self.table)
+        self.copy_shortcut.activated.connect(self.copy)
+
+        # the model is made once the columns are known
+        self.model = None
 
-        self.layout.addWidget(self.webView)
+        self.status_label = QLabel()
+        self.layout.addWidget(self.status_label)
 
         self.button_hbx = QHBoxLayout()
 
@@ -500,24 +1154,198 @@ class ReportDialog(QDialog):
         self.close_btn.clicked.connect(self.close)
         self.button_hbx.addWidget(self.close_btn)
 
+        self.more_btn = QPushButton("Load &more")
+        self.more_btn.clicked.connect(self.loadMore)
+        self.more_btn.setEnabled(False)
+        self.button_hbx.addWidget(self.more_btn)
+
+        self.stop_btn = QPushButton("&Stop")
+        self.stop_btn.clicked.connect(self.cancel)
+        self.button_hbx.addWidget(self.stop_btn)
+
+        self.copy_btn = QPushButton("C&opy")
+        self.copy_btn.clicked.connect(self.copy)
+        self.button_hbx.addWidget(self.copy_btn)
+
+        self.export_btn = QPushButton("&Export")
+        self.export_btn.clicked.connect(self.export)
+        self.button_hbx.addWidget(self.export_btn)
+
         self.print_btn = QPushButton("&Print")
         self.print_btn.clicked.connect(self.print)
         self.button_hbx.addWidget(self.print_btn)
 
         self.layout.addLayout(self.button_hbx)
 
-        self.webView.setHtml(self.html(title, columns, data))
+        self._export_task = None
+
+        self._start()
+
+    def _start(self):
+        """Start a task reading the next rows of the report"""
+        self.cancel()
+        self._generation += 1
+
+        self._task = ReportTask(self._generation,
+                                self.db,
+                                self.sql,
+                                self.row_count,
+                                self.row_limit)
+        self._task.signals.rows.connect(self._rowsReady)
+        self._task.signals.failed.connect(self._failed)
+
+        self.more_btn.setEnabled(False)
+        self.stop_btn.setEnabled(True)
+        self.status_label.setText("Loading...")
+
+        QThreadPool.globalInstance().start(self._task)
+
+    def cancel(self, *args):
+        """Stop the report if it is still running"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+            self.stop_btn.setEnabled(False)
+            self.status_label.setText("%d rows (stopped)" % self.row_count)
+
+    def loadMore(self, *args):
+        self._start()
+
+    def _rowsReady(self, generation, columns, rows, done, more):
+        """Add a batch of rows delivered by a ReportTask"""
+
+        # drop results of a cancelled task
+        if generation != self._generation:
+            return
+
+        if self.model is None:
+            self.model = ReportModel(self.table, columns)
+            self.table.setModel(self.model)
+
+            # keep the report's order until a header is clicked
+            self.table.horizontalHeader().setSortIndicator(
+                -1, Qt.AscendingOrder)
+            self.table.setSortingEnabled(True)
+
+        if rows:
+            first_batch = self.row_count == 0
+            self.row_count += len(rows)
+            self.model.add_rows(rows)
+            if first_batch:
+                self.table.resizeColumnsToContents()
+            self.status_label.setText("Loading... %d rows" %
+                                      self.row_count)
+
+        if done:
+            self._caching_task = self._task if more else None
+            self._task = None
+            self.stop_btn.setEnabled(False)
+            self.more_btn.setEnabled(more)
+            if more:
+                self.status_label.setText("First %d rows" % self.row_count)
+            else:
+                self.status_label.setText("%d rows" % self.row_count)
+
+    def _failed(self, generation, message):
+        if generation != self._generation:
+            return
+
+        self._task = None
+        self.stop_btn.setEnabled(False)
+        self.status_label.setText("The report failed: %s" % message)
+
+    def export(self, *args):
+        """Write all the results of the report to a file chosen by the
+        user, whatever the row limit"""
+
+        fn, _ = QFileDialog.getSaveFileName(
+            self,
+            "Export report",
+            self.title,
+            "CSV files (*.csv);;JSON lines (*.jsonl);;" +
+            "Columnar files (*.qmc)")
+
+        if not fn:
+            return
+
+        try:
+            format_for(fn)
+        except ValueError as e:
+            self.status_label.setText(str(e))
+            return
+
+        self._export_task = ExportTask(self.db, self.sql, fn)
+        self._export_task.signals.finished.connect(
+            lambda count: self._exported(fn, count))
+        self._export_task.signals.failed.connect(self._exportFailed)
+
+        self.export_btn.setEnabled(False)
+        self.status_label.setText("Exporting to %s..." %
+                                  os.path.basename(fn))
+
+        QThreadPool.globalInstance().start(self._export_task)
+
+    def _exported(self, filename, count):
+        self._export_task = None
+        self.export_btn.setEnabled(True)
+        self.status_label.setText("Exported %d rows to %s" %
+                                  (count, os.path.basename(filename)))
+
+    def _exportFailed(self, message):
+        self._export_task = None
+        self.export_btn.setEnabled(True)
+        self.status_label.setText("The export failed: %s" % message)
+
+    def _cancelAll(self):
+        self.cancel()
+        if self._caching_task:
+            self._caching_task.cancel()
+            self._caching_task = None
+        if self._export_task:
+            self._export_task.cancel()
+            self._export_task = None
+
+    def done(self, result):
+        self._cancelAll()
+        QDialog.done(self, result)
+
+    def closeEvent(self, event):
+        self._cancelAll()
+        QDialog.closeEvent(self, event)
+
+    def copy(self, *args):
+        """Copy the selected cells to the clipboard"""
+        if self.model:
+            indexes = self.table.selectionModel().selectedIndexes()
+            if indexes:
+                QApplication.clipboard().setText(self.model.text(indexes))
 
     def print(self, *args):
         dialog = QPrintDialog()
         if dialog.exec_() == QDialog.Accepted:
             print("printing report")
-            self.webView.print(dialog.printer())
+
+            # print the rows loaded, as they are shown
+            if self.model:
+                columns, rows = self.model.columns, self.model.rows
+            else:
+                columns, rows = [], []
+
+            doc = QTextDocument()
+            doc.setHtml(self.html(self.title, columns, rows))
+            doc.print_(dialog.printer())
 
     def exec_(self):
         self.showMaximized()
         QDialog.exec_(self)
 
+    def html_rows(self, data):
+        return "\n".join(["<tr>" + "".join(
+            ["<td>%s</td>" % ("" if datum is None
+                              else escape(str(datum)))
+             for datum in row])  + "</tr>"
+                          for row in data])
+
     def html(self, title, columns, data):
         tmpl = """<html>
 <head><title>%(title)s</title></head>
@@ -530,17 +1358,12 @@ class ReportDialog(QDialog):
 </body>
 </html>"""
         
-        header = "".join(["<th align='left'>%s</th>" % col
+        header = "".join(["<th align='left'>%s</th>" % escape(col)
                           for col in columns])
 
-        rows = "\n".join(["<tr>" + "".join(
-            ["<td>%s</td>" % datum
-             for datum in row])  + "</tr>"
-                          for row in data])
-
-        html =  tmpl % {"title": title,
+        html =  tmpl % {"title": escape(title),
                         "header": header,
-                        "rows": rows}
+                        "rows": self.html_rows(data)}
 
         return html
 
@@ -553,6 +1376,11 @@ class DeepLarder(QMainWindow):
         # if a file is loaded, its name will be stored here
         self.filename = ""
 
+        # the database and the model of the inventory table, once a
+        # file is loaded
+        self.db = None
+        self.inventory_model = None
+
         # .ini file for settings
         self.settings = QSettings()
         
@@ -563,6 +1391,12 @@ class DeepLarder(QMainWindow):
 
         self._addControls()
 
+        # notice changes made to the file by other programs
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(poll_interval)
+        self.poll_timer.timeout.connect(self._pollChanges)
+        self.poll_timer.start()
+
         # read the last file opened from the settings file
         last_file = self.settings.value("last file")
 
@@ -600,14 +1434,12 @@ class DeepLarder(QMainWindow):
         item = self.inventory_model.items[row].clone("inventory")
 
         frm = InventoryItemDialog(self,
-                                  self.allGoals(),
+                                  self.db.goal_catalog(),
                                   self.amounts,
                                   item)
         frm.exec()
 
         if not frm.canceled:
-            self.items.append(frm.item)
-            self._setModel()
             self.db.add_inventory(frm.item)
 
     def _deleteItem(self, *args):
@@ -627,15 +1459,10 @@ class DeepLarder(QMainWindow):
         
         if ret == QMessageBox.Ok:
             self.db.delete_item(item)
-            self._showItems()
+            self._selectionChanged()
         elif ret == QMessageBox.Cancel:
             pass
 
-    def allGoals(self):
-        goals = self.db.all_inventory("goal")
-        goals.sort(key=lambda g: "%s (%s)" % (g.description, g.condition))
-        return goals
-    
     def _showEdit(self, *args):
         """Show a dialog to edit the selected item"""
 
@@ -649,7 +1476,7 @@ class DeepLarder(QMainWindow):
             
         else:
             frm = InventoryItemDialog(self,
-                                      self.allGoals(),
+                                      self.db.goal_catalog(),
                                       self.amounts,
                                       item)
             frm.exec()
@@ -669,13 +1496,13 @@ class DeepLarder(QMainWindow):
             if frm.item:
                 self.db.add_inventory(frm.item, "goal")
         else:
-            frm = InventoryItemDialog(self, self.allGoals(), self.amounts)
+            frm = InventoryItemDialog(self,
+                                      self.db.goal_catalog(),
+                                      self.amounts)
 
             frm.exec()
 
             if not frm.canceled:
-                self.items.append(frm.item)
-                self._setModel()
                 self.db.add_inventory(frm.item)
 
     def _loadFile(self, filename):
@@ -685,8 +1512,16 @@ class DeepLarder(QMainWindow):
         
         self.setWindowTitle(
             "%s (%s)" % (app_name, os.path.basename(self.filename)))
+
+        if self.db:
+            self.db.close()
         self.db = InventoryDB(self.filename)
 
+        self.profileAction.setEnabled(True)
+        self.profileAction.setChecked(self.db.profile == "performance")
+
+        self._fillScenarioMenu()
+
         # cache some immutable information from the database
         self.conditions = [str(key)
                            for key in self.db.conditions.keys()]
@@ -701,8 +1536,6 @@ class DeepLarder(QMainWindow):
 
     def _showItems(self):
         """Show the items on the form"""
-        self.items = self.db.all_inventory(
-            self.view_combo.currentText().lower())
         self._setModel()
         self._selectionChanged()
         
@@ -752,20 +1585,70 @@ class DeepLarder(QMainWindow):
             self.view_combo.setCurrentIndex(1)
             
 
+    def _browseImportFile(self, *args, **kwargs):
+        """Show a file dialog to import inventory from a CSV or JSONL file"""
+
+        fn, _ = QFileDialog.getOpenFileName(
+            self,
+            'Import inventory',
+            self.settings.value("save directory"),
+            "Inventory lists (*.csv *.jsonl)")
+
+        # if a file was chosen, import it into the current view
+        if fn:
+            view = self.view_combo.currentText().lower()
+            try:
+                self.db.import_file(fn, view)
+            except (KeyError, ValueError) as e:
+                mb = QMessageBox()
+                mb.setIcon(QMessageBox.Warning)
+                mb.setText("Could not import %s: %s" % (
+                    os.path.basename(fn), e))
+                mb.exec_()
+
     def _getRationNumber(self):
         """Show a dialog to determine base ration multiplier and return it"""
         dlg = RationMultiplierDialog(self, self.db)
         dlg.exec()
         return dlg.value
 
+    def _pollChanges(self):
+        if self.db:
+            self.db.poll_changes()
+
+    def _setProfile(self, checked):
+        """Switch the storage profile of the current file"""
+        profile = "performance" if checked else "default"
+        if self.db and self.db.profile != profile:
+            try:
+                self.db.set_profile(profile)
+            except OperationalError as e: # another program has it open
+                mb = QMessageBox()
+                mb.setIcon(QMessageBox.Warning)
+                mb.setText("Could not change storage: %s" % e)
+                mb.exec_()
+                self.profileAction.setChecked(self.db.profile ==
+                                              "performance")
+
+    def closeEvent(self, event):
+        if self.db:
+            self.db.close()
+            self.db = None
+        QMainWindow.closeEvent(self, event)
+
     def _setGoals(self):
         """Add database records for inventory goals"""
         
         multiplier = self._getRationNumber()
         
         if multiplier:
-            self.db.set_goals(multiplier)
-            self._setModel()
+            name, ok = QInputDialog.getText(
+                self,
+                "Goal scenario",
+                "Save these goals as a scenario named (leave blank " +
+                "not to save):")
+            self.db.set_goals(multiplier, name.strip() if ok else None)
+            self._fillScenarioMenu()
         else: # if the dialog was canceled, let the user know no goals
             # were set
             mb = QMessageBox()
@@ -773,14 +1656,43 @@ class DeepLarder(QMainWindow):
             mb.setText("Goals not set.")
             mb.exec_()
 
+    def _fillScenarioMenu(self):
+        """List the saved goal scenarios, checking the one in use"""
+
+        self.scenario_menu.clear()
+        for action in self.scenario_group.actions():
+            self.scenario_group.removeAction(action)
+
+        for name, multiplier, active in self.db.scenarios():
+            action = QAction(name, self)
+            action.setCheckable(True)
+            action.setChecked(active)
+            action.setStatusTip("Goals of %g times the recommendation " %
+                                multiplier + "for an adult male")
+            action.triggered.connect(self._scenarioAction(name))
+            self.scenario_group.addAction(action)
+            self.scenario_menu.addAction(action)
+
+        self.scenario_menu.setEnabled(len(self.scenario_group.actions()) > 0)
+
+    def _scenarioAction(self, name):
+        return lambda *args: self.db.use_scenario(name)
+
     def _setModel(self):
         """Having loaded a file, show the items in the tableview"""
         
         self.filter_entry.setText("")
 
-        # build and use  a new list model
-        self.inventory_model = InventoryListModel(self.inventory_table,
-                                                  self.items)
+        # stop the old model filtering and following changes
+        if self.inventory_model is not None:
+            self.inventory_model.close()
+
+        # build and use a new list model, which reads the rows for the
+        # current view from the database as they are needed
+        self.inventory_model = InventoryListModel(
+            self.inventory_table,
+            self.db,
+            self.view_combo.currentText().lower())
         self.inventory_table.setModel(self.inventory_model)
 
         # hide the ID column
@@ -794,7 +1706,7 @@ class DeepLarder(QMainWindow):
         
         filter_text = self.filter_entry.text()
         
-        if self.inventory_model:
+        if self.inventory_model is not None:
             self.inventory_model.set_filter(filter_text)
 
     def _setUpToolbar(self):
@@ -831,6 +1743,22 @@ class DeepLarder(QMainWindow):
 
         self.file_menu.addAction(self.openAction)
 
+        self.importAction = QAction(QIcon('import.png'), '&Import', self)
+        self.importAction.setStatusTip(
+            'Import inventory from a CSV or JSONL file')
+        self.importAction.triggered.connect(self._browseImportFile)
+
+        self.file_menu.addAction(self.importAction)
+
+        self.profileAction = QAction('Fast &storage', self)
+        self.profileAction.setCheckable(True)
+        self.profileAction.setEnabled(False)
+        self.profileAction.setStatusTip(
+            'Keep this file in WAL mode with larger caches for faster saves')
+        self.profileAction.toggled.connect(self._setProfile)
+
+        self.file_menu.addAction(self.profileAction)
+
         self.file_menu.addSeparator()
         
         self.exitAction = QAction(QIcon('exit.png'), '&Exit', self)
@@ -849,6 +1777,12 @@ class DeepLarder(QMainWindow):
 
         self.inventory_menu.addAction(self.setGoalAction)
 
+        # the saved goal scenarios, filled in when a file is loaded
+        self.scenario_menu = self.inventory_menu.addMenu("Goal &scenarios")
+        self.scenario_group = QActionGroup(self)
+        self.scenario_group.setExclusive(True)
+        self.scenario_menu.setEnabled(False)
+
         self.inventory_menu.addSeparator()
 
         
@@ -946,9 +1880,8 @@ class DeepLarder(QMainWindow):
         
 
     def _showReport(self, report):
-        
-        cols, data = self.db.execute_no_commit(report.sql)
-        td = ReportDialog(self, report.title, cols, data)
+        td = ReportDialog(self, report.title, self.db, report.sql,
+                          report_row_limit)
         td.exec_()
 
     def _selectionChanged(self, *args):
@@ -986,10 +1919,17 @@ class DeepLarder(QMainWindow):
             self._viewComboChanged)
         self.control_hbx.addWidget(self.view_combo)
 
-        # a way to enter filters
+        # a way to enter filters; the filter is applied once typing
+        # pauses
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(150)
+        self.filter_timer.timeout.connect(self._filterItems)
+        
         self.filter_entry = QLineEdit()
         self.filter_entry.setPlaceholderText("Filter text. . . ")
-        self.filter_entry.textChanged.connect(self._filterItems)
+        self.filter_entry.textChanged.connect(
+            lambda *args: self.filter_timer.start())
         self.control_hbx.addWidget(self.filter_entry)
 
         # filter clearing button
@@ -1022,6 +1962,7 @@ class DeepLarder(QMainWindow):
         self.show()
         qt_app.exec_()
 
-app = DeepLarder()
+if __name__ == "__main__":
+    app = DeepLarder()
 
-app.run()
+    app.run()
@@ -0,0 +1,79 @@
+"""Time adding inventory one item at a time against add_inventory_many(),
+each on a fresh .qm file.
+
+Usage: python bench/bench_import.py [SIZE ...]
+
+The sizes default to 1,000, 10,000 and 100,000 items.  Each item added
+one at a time is its own transaction and waits for the disk, so on a
+slow disk the largest size takes many minutes that way.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# the SQL scripts are found relative to the application directory
+app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+default_sizes = [1000, 10000, 100000]
+
+def make_items(n):
+    from inventory import InventoryItem, Measurement
+
+    return [InventoryItem(None,
+                          "Canned",
+                          "Beans %d" % i,
+                          Measurement(i % 40 + 1, "pound"),
+                          Measurement(2, "year"),
+                          datetime(2020, 1, i % 28 + 1))
+            for i in range(n)]
+
+def time_adding(directory, n, batched):
+    """Return the seconds taken to add <n> items to a new file"""
+
+    from inventory import InventoryDB
+
+    path = os.path.join(directory,
+                        "%s-%d.qm" % ("batched" if batched else "single", n))
+    db = InventoryDB(path)
+    try:
+        items = make_items(n)
+
+        start = time.perf_counter()
+        if batched:
+            db.add_inventory_many(items)
+        else:
+            for item in items:
+                db.add_inventory(item)
+        elapsed = time.perf_counter() - start
+
+        # make sure every row arrived
+        db.cur.execute("select count(*) from item where record_type_id = ?",
+                       (db.record_types["inventory"],))
+        assert db.cur.fetchone()[0] == n
+    finally:
+        db.close()
+
+    return elapsed
+
+def main(argv):
+    sizes = [int(arg) for arg in argv] or default_sizes
+
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+
+    print("%10s %12s %12s %9s" % ("items", "per item", "batched", "speedup"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for n in sizes:
+            single = time_adding(directory, n, False)
+            batched = time_adding(directory, n, True)
+            print("%10d %11.3fs %11.3fs %8.0fx" % (n, single, batched,
+                                                   single / batched))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,118 @@
+"""Measure the memory each inventory row takes once loaded, as items
+were loaded before they had __slots__ and shared values, and as
+all_inventory() loads them now.
+
+Usage: python bench/bench_memory.py [ROWS]
+
+A fresh .qm file is filled with ROWS items (1,000,000 by default) and
+read back both ways.  Prints the bytes held per row once loading is
+done, and the peak while loading, as counted by tracemalloc.
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from bench_import import app_dir, make_items
+
+default_rows = 1000000
+
+class OldMeasurement(object):
+    """A Measurement as it was, with a __dict__"""
+    def __init__(self, number, unit):
+        self.number = number
+        self.unit = unit
+
+class OldInventoryItem(object):
+    """An InventoryItem as it was, with a __dict__"""
+    def __init__(self, id, condition, description, amount, life,
+                 purchase_date):
+        self.id = id
+        self.condition = condition
+        self.description = description
+        self.amount = amount
+        self.life = life
+        self.purchase_date = purchase_date
+
+def load_old(db):
+    """Load the inventory as all_inventory() did: two new Measurements
+    and a new datetime for every row"""
+
+    sql, params = db.inventory_query("inventory")
+    cur = db.conn.cursor()
+    cur.execute(sql, params)
+
+    output = []
+    for row in cur.fetchall():
+        (id,
+         condition,
+         description,
+         amount,
+         amount_unit,
+         life,
+         life_unit,
+         record_type,
+         purchase_date,
+         expiration_date) = row
+
+        if purchase_date is not None:
+            purchase_date = datetime.fromisoformat(purchase_date)
+
+        output.append(OldInventoryItem(id,
+                                       condition,
+                                       description,
+                                       OldMeasurement(amount, amount_unit),
+                                       OldMeasurement(life, life_unit),
+                                       purchase_date))
+    cur.close()
+
+    return output
+
+def measure(load, db):
+    """Return (bytes held, peak bytes, rows, seconds) for loading the
+    inventory with <load>"""
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    items = load(db)
+    elapsed = time.perf_counter() - start
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return held, peak, len(items), elapsed
+
+def main(argv):
+    rows = int(argv[0]) if argv else default_rows
+
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+
+    from inventory import InventoryDB
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = InventoryDB(os.path.join(directory, "memory.qm"),
+                         "performance")
+        try:
+            db.add_inventory_many(make_items(rows))
+
+            print("%d rows" % rows)
+            print("%-8s %12s %12s %10s" % ("", "bytes/row", "peak/row",
+                                           "load"))
+            for name, load in [("before", load_old),
+                               ("after", InventoryDB.all_inventory)]:
+                held, peak, n, elapsed = measure(load, db)
+                assert n == rows
+                print("%-8s %12.0f %12.0f %9.2fs" % (name, held / n,
+                                                     peak / n, elapsed))
+        finally:
+            db.close()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,121 @@
+"""Time writes, and reports running alongside them, under each storage
+profile.
+
+Usage: python bench/bench_profile.py [ROWS [SECONDS]]
+
+For each profile, a fresh .qm file is filled with ROWS items (50,000 by
+default).  Then for SECONDS (10 by default) items are added one at a
+time, each committed as the GUI saves them, while another thread runs
+a report over and over on the read-only pool.  Prints the writes per
+second, the number of reports run and of those that gave up waiting
+for the writer ("database is locked"), and the median and 95th
+percentile time of a write and of a report.
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from sqlite3 import OperationalError
+
+from bench_import import app_dir, make_items
+
+default_rows = 50000
+default_seconds = 10
+
+# a report that reads the whole inventory
+report_file = os.path.join("reports", "nearing-expiration.rpt")
+
+def percentiles(times):
+    """Return the median and 95th percentile of <times>, in
+    milliseconds"""
+    if len(times) < 2:
+        return (times[0] * 1000, times[0] * 1000) if times else (0, 0)
+    cuts = statistics.quantiles(times, n=20)
+    return statistics.median(times) * 1000, cuts[18] * 1000
+
+def run(directory, profile, rows, seconds):
+    """Return (write times, report times, reports failed) for
+    <profile>"""
+
+    from inventory import InventoryDB, Report
+
+    path = os.path.join(directory, "%s.qm" % profile)
+    db = InventoryDB(path, profile)
+    try:
+        db.set_goals(1)
+        db.add_inventory_many(make_items(rows))
+        sql = Report(report_file).sql
+
+        # make sure the pool is open before timing starts
+        list(db.iter_report(sql, cache=False))
+
+        report_times = []
+        failed = []
+        stop = threading.Event()
+
+        def read():
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    for _ in db.iter_report(sql, cache=False):
+                        pass
+                except OperationalError:
+                    failed.append(time.perf_counter() - start)
+                else:
+                    report_times.append(time.perf_counter() - start)
+
+        reader = threading.Thread(target=read)
+        reader.start()
+
+        write_times = []
+        try:
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                item = make_items(1)[0]
+                start = time.perf_counter()
+                db.add_inventory(item)
+                write_times.append(time.perf_counter() - start)
+        finally:
+            stop.set()
+            reader.join()
+    finally:
+        db.close()
+
+    return write_times, report_times, len(failed)
+
+def main(argv):
+    rows = int(argv[0]) if argv else default_rows
+    seconds = float(argv[1]) if len(argv) > 1 else default_seconds
+
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+
+    from inventory import storage_profiles
+
+    print("%d rows, %g seconds each" % (rows, seconds))
+    print("%-12s %9s %10s %10s %8s %7s %10s %10s" % ("profile",
+                                                     "writes/s",
+                                                     "write p50",
+                                                     "write p95",
+                                                     "reports",
+                                                     "failed",
+                                                     "read p50",
+                                                     "read p95"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in sorted(storage_profiles):
+            write_times, report_times, failed = run(directory, profile,
+                                                    rows, seconds)
+            print("%-12s %9.0f %8.2fms %8.2fms %8d %7d %8.1fms %8.1fms" %
+                  ((profile, len(write_times) / seconds) +
+                   percentiles(write_times) +
+                   (len(report_times), failed) +
+                   percentiles(report_times)))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,127 @@
+"""Time repainting the inventory table while scrolling through it, with
+data() as it was before rows were formatted once and kept, and as it is
+now.
+
+Usage: python bench/bench_scroll.py [ROWS]
+
+A fresh .qm file is filled with ROWS items (100,000 by default) and
+read into an InventoryListModel.  A 40-row view is then scrolled from
+top to bottom three rows (one wheel step) at a time, asking data() for
+every visible cell at each step, and then repainted in place as often.
+Prints the time per repaint and per cell.  Needs PyQt5, but no
+display.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from bench_import import app_dir, make_items
+
+default_rows = 100000
+
+# the rows a view shows at once, and how far a wheel step moves it
+visible_rows = 40
+scroll_rows = 3
+
+def old_data(model, index, role):
+    """InventoryListModel.data() as it was: each cell looked up by name
+    and formatted on every paint, working out what it holds from the
+    exceptions, with expiration dates calculated every time"""
+
+    from PyQt5.QtCore import Qt
+
+    attrib = model.item_attribs[index.column()]
+
+    if not index.isValid():
+        return None
+    elif role != Qt.DisplayRole:
+        return None
+
+    item = model.items[index.row()]
+    if attrib == "expiration_date":
+        try:
+            val = item.calculate_expiration_date()
+        except ValueError:
+            val = None
+    else:
+        val = getattr(item, attrib)
+
+    try:
+        val = val.to_string()
+    except:
+        try:
+            val = val.strftime("%B %d, %Y")
+        except:
+            pass
+
+    return val
+
+def repaint(model, data, tops):
+    """Ask <data> for every cell of a view showing the rows from each of
+    <tops>; return the seconds taken and the cells painted"""
+
+    from PyQt5.QtCore import Qt
+
+    columns = model.columnCount(None)
+    cells = 0
+
+    start = time.perf_counter()
+    for top in tops:
+        for row in range(top, top + visible_rows):
+            for column in range(columns):
+                data(model, model.index(row, column), Qt.DisplayRole)
+        cells += visible_rows * columns
+
+    return time.perf_counter() - start, cells
+
+def main(argv):
+    rows = int(argv[0]) if argv else default_rows
+
+    # no display is needed to drive a model
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+
+    from app import InventoryListModel
+    from inventory import InventoryDB
+
+    scrolled = list(range(0, rows - visible_rows + 1, scroll_rows))
+    in_place = [0] * len(scrolled)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = InventoryDB(os.path.join(directory, "scroll.qm"),
+                         "performance")
+        try:
+            db.add_inventory_many(make_items(rows))
+
+            model = InventoryListModel(None, db, "inventory",
+                                       page_size=1000)
+            while model.canFetchMore(None):
+                model.fetchMore(None)
+
+            print("%d rows, %d repaints of %d rows" % (len(model.items),
+                                                       len(scrolled),
+                                                       visible_rows))
+            print("%-22s %10s %12s %10s" % ("", "total", "per repaint",
+                                            "per cell"))
+
+            for name, data, tops in [
+                    ("before, scrolling", old_data, scrolled),
+                    ("after, scrolling", InventoryListModel.data, scrolled),
+                    ("before, in place", old_data, in_place),
+                    ("after, in place", InventoryListModel.data, in_place)]:
+                elapsed, cells = repaint(model, data, tops)
+                print("%-22s %9.2fs %10.3fms %8.2fus" %
+                      (name, elapsed, elapsed / len(tops) * 1000,
+                       elapsed / cells * 1e6))
+
+            model.close()
+        finally:
+            db.close()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
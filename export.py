@@ -0,0 +1,362 @@
+"""Export the results of a report as CSV, JSON lines or a compact
+column-oriented binary file, a batch of rows at a time.
+
+Usage: python export.py [-f FORMAT] [-o OUTPUT] [--sql] DATABASE REPORT
+
+REPORT is a .rpt file, or with --sql, the text of a query.  Without
+-o, the output goes to standard output.
+"""
+
+import os
+import sys
+import argparse
+import base64
+import csv
+import json
+import struct
+import zlib
+from array import array
+
+# the export scripts are found relative to the application directory
+app_dir = os.path.dirname(os.path.abspath(__file__))
+
+# how many rows to read from the database at a time; a columnar file
+# stores each batch as one group of columns
+export_batch_size = 4096
+
+# The columnar format: the magic number and the number of columns, the
+# length and UTF-8 name of each column, then a group for each batch of
+# rows: the number of rows, then for each column, a type tag, the
+# length of the data and the data, compressed with zlib.  A group of
+# no rows ends the file.  Each column's data starts with a bitmap with
+# a bit set for each row that isn't null; the values of the other rows
+# follow, by type tag:
+#
+#   n  none; every row is null
+#   i  64-bit integers
+#   f  64-bit floats
+#   s  the length of each UTF-8 string, as 32-bit integers, then the
+#      strings
+#   b  the same for blobs
+#   j  the same for JSON text, for columns mixing types; blobs among
+#      them become base64 strings
+#
+# Numbers are little-endian.
+columnar_magic = b"QMC1"
+
+def _json_default(value):
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError("Can't export %r" % (value,))
+
+def _csv_row(row):
+    return [_json_default(value) if isinstance(value, bytes) else value
+            for value in row]
+
+def write_csv(batches, f):
+    """Write each (columns, rows) batch to the text file <f> as CSV, with
+    the column names first and blobs in base64, as in JSON lines; return
+    the number of rows written"""
+
+    writer = csv.writer(f)
+    count = 0
+    started = False
+
+    for columns, rows in batches:
+        if not started:
+            writer.writerow(columns)
+            started = True
+        writer.writerows(map(_csv_row, rows))
+        count += len(rows)
+
+    return count
+
+def write_jsonl(batches, f):
+    """Write each (columns, rows) batch to the text file <f> as JSON
+    objects, one per line; return the number of rows written"""
+
+    count = 0
+
+    for columns, rows in batches:
+        for row in rows:
+            f.write(json.dumps(dict(zip(columns, row)),
+                               default=_json_default))
+            f.write("\n")
+        count += len(rows)
+
+    return count
+
+def _column_type(values):
+    """Return the type tag for a column of non-null <values>"""
+
+    types = set(map(type, values))
+
+    if not types:
+        return b"n"
+    elif types == {int}:
+        if all(-2**63 <= value < 2**63 for value in values):
+            return b"i"
+        else:
+            return b"j"
+    elif types <= {int, float}:
+        return b"f"
+    elif types == {str}:
+        return b"s"
+    elif types == {bytes}:
+        return b"b"
+    else:
+        return b"j"
+
+def _little_endian(arr):
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tobytes()
+
+def _encode_column(values):
+    """Return the type tag and uncompressed data for one column of a
+    group"""
+
+    bitmap = bytearray((len(values) + 7) // 8)
+    present = []
+    for i, value in enumerate(values):
+        if value is not None:
+            bitmap[i >> 3] |= 1 << (i & 7)
+            present.append(value)
+
+    tag = _column_type(present)
+
+    if tag == b"n":
+        data = b""
+    elif tag == b"i":
+        data = _little_endian(array("q", present))
+    elif tag == b"f":
+        data = _little_endian(array("d", present))
+    else:
+        if tag == b"s":
+            encoded = [value.encode("utf-8") for value in present]
+        elif tag == b"b":
+            encoded = present
+        else:
+            encoded = [json.dumps(value,
+                                  default=_json_default).encode("utf-8")
+                       for value in present]
+
+        data = (_little_endian(array("I", map(len, encoded))) +
+                b"".join(encoded))
+
+    return tag, bytes(bitmap) + data
+
+def write_columnar(batches, f):
+    """Write each (columns, rows) batch to the binary file <f> as a group
+    of the columnar format; return the number of rows written"""
+
+    count = 0
+    started = False
+
+    for columns, rows in batches:
+        if not started:
+            f.write(columnar_magic)
+            f.write(struct.pack("<I", len(columns)))
+            for column in columns:
+                name = column.encode("utf-8")
+                f.write(struct.pack("<H", len(name)))
+                f.write(name)
+            started = True
+
+        if not rows:
+            continue
+
+        f.write(struct.pack("<I", len(rows)))
+        for values in zip(*rows):
+            tag, data = _encode_column(values)
+            data = zlib.compress(data)
+            f.write(struct.pack("<cI", tag, len(data)))
+            f.write(data)
+
+        count += len(rows)
+
+    f.write(struct.pack("<I", 0))
+
+    return count
+
+def _from_little_endian(typecode, data):
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+def _decode_column(tag, data, n):
+    """Return the values of one column of a group of <n> rows"""
+
+    bitmap_size = (n + 7) // 8
+    bitmap, data = data[:bitmap_size], data[bitmap_size:]
+    present = [i
+               for i in range(n)
+               if bitmap[i >> 3] & (1 << (i & 7))]
+
+    if tag == b"n":
+        values = []
+    elif tag == b"i":
+        values = _from_little_endian("q", data)
+    elif tag == b"f":
+        values = _from_little_endian("d", data)
+    else:
+        lengths = _from_little_endian("I", data[:4 * len(present)])
+        pos = 4 * len(present)
+        values = []
+        for length in lengths:
+            values.append(data[pos:pos + length])
+            pos += length
+
+        if tag == b"s":
+            values = [value.decode("utf-8") for value in values]
+        elif tag == b"j":
+            values = [json.loads(value.decode("utf-8"))
+                      for value in values]
+
+    column = [None] * n
+    for i, value in zip(present, values):
+        column[i] = value
+    return column
+
+def read_columnar(f):
+    """Read the binary file <f> in the columnar format and yield
+    (columns, rows) for each group"""
+
+    def read(size):
+        data = f.read(size)
+        if len(data) != size:
+            raise ValueError("The columnar file is cut short")
+        return data
+
+    if read(4) != columnar_magic:
+        raise ValueError("Not a columnar export file")
+
+    columns = []
+    for i in range(struct.unpack("<I", read(4))[0]):
+        length = struct.unpack("<H", read(2))[0]
+        columns.append(read(length).decode("utf-8"))
+
+    while True:
+        n = struct.unpack("<I", read(4))[0]
+        if n == 0:
+            return
+
+        values = []
+        for column in columns:
+            tag, length = struct.unpack("<cI", read(5))
+            values.append(_decode_column(tag,
+                                         zlib.decompress(read(length)),
+                                         n))
+
+        yield list(columns), list(zip(*values))
+
+# the writer for each format and whether it writes text
+export_formats = {"csv": (write_csv, True),
+                  "jsonl": (write_jsonl, True),
+                  "qmc": (write_columnar, False)}
+
+def format_for(filename):
+    """Return the export format named by <filename>'s extension"""
+
+    format = os.path.splitext(filename)[1].lower().lstrip(".")
+    if format not in export_formats:
+        raise ValueError("Can't export to %s: expected a .csv, .jsonl or "
+                         ".qmc file" % filename)
+    return format
+
+def write_report(db, sql, f, format, cancelled=None):
+    """Run <sql> on <db> and write the results to the open file <f> in
+    <format>, without keeping more than a batch of rows in memory;
+    return the number of rows written"""
+
+    writer, _ = export_formats[format]
+
+    return writer(db.iter_report(sql,
+                                 export_batch_size,
+                                 cancelled=cancelled,
+                                 cache=False),
+                  f)
+
+def export_report(db, sql, filename, format=None, cancelled=None):
+    """Run <sql> on <db> and write the results to <filename>, in the
+    format its extension names unless <format> is given; return the
+    number of rows written"""
+
+    if format is None:
+        format = format_for(filename)
+
+    _, text = export_formats[format]
+
+    if text:
+        # the csv module writes its own line endings
+        f = open(filename, "w", encoding="utf-8", newline="")
+    else:
+        f = open(filename, "wb")
+
+    with f:
+        return write_report(db, sql, f, format, cancelled)
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Export the results of a report on a .qm file")
+    parser.add_argument("database")
+    parser.add_argument("report",
+                        help="a .rpt file, or with --sql, a query")
+    parser.add_argument("--sql", action="store_true",
+                        help="take REPORT as the text of a query")
+    parser.add_argument("-f", "--format", choices=sorted(export_formats),
+                        help="the format to write (default: from the " +
+                        "output file's extension, or csv)")
+    parser.add_argument("-o", "--output",
+                        help="the file to write (default: standard output)")
+    args = parser.parse_args(argv)
+
+    output = args.output and os.path.abspath(args.output)
+
+    format = args.format
+    if format is None and output:
+        try:
+            format = format_for(output)
+        except ValueError as e:
+            parser.error(str(e))
+    elif format is None:
+        format = "csv"
+
+    database = os.path.abspath(args.database)
+    if not os.path.isfile(database):
+        print("%s: no such file" % args.database, file=sys.stderr)
+        return 1
+
+    if args.sql:
+        sql = args.report
+    else:
+        report_file = os.path.abspath(args.report)
+
+    os.chdir(app_dir)
+    from inventory import InventoryDB, Report
+
+    if not args.sql:
+        sql = Report(report_file).sql
+
+    db = InventoryDB(database)
+    try:
+        if output:
+            count = export_report(db, sql, output, format)
+        elif export_formats[format][1]:
+            out = open(sys.stdout.fileno(), "w", encoding="utf-8",
+                       newline="", closefd=False)
+            with out:
+                count = write_report(db, sql, out, format)
+        else:
+            count = write_report(db, sql, sys.stdout.buffer, format)
+            sys.stdout.buffer.flush()
+    finally:
+        db.close()
+
+    print("%d rows exported" % count, file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,10 +1,18 @@
 import os
-from sqlite3 import connect
+from sqlite3 import connect, complete_statement, OperationalError
 import codecs
+import csv
+import json
 import math
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from dateutil.parser import parse
 from glob import glob
+from pathlib import Path
 
 class Report(object):
     def __init__(self, filename=None):
@@ -44,11 +52,31 @@ class Report(object):
         rpt.sql = dic["sql"]
         return rpt
             
+# SQL to return the base unit and factor of each unit
+unit_conversions_sql = """
+select u.unit,
+b.unit,
+ub.factor
+from unit_base ub
+inner join unit u
+on ub.id = u.id
+inner join unit b
+on ub.base_id = b.id"""
+
 class Measurement(object):
-    """Represents a numeric measurement with a unit"""
-    def __init__(self, number, unit):
+    """Represents a numeric measurement with a unit; items loaded from the
+    database share equal Measurements, so replace one rather than
+    changing it.  One read from a file carries that file's unit
+    conversions (see InventoryDB.conversions) and compares by quantity
+    with others of the same dimension; without any, units compare by
+    name."""
+
+    __slots__ = ("number", "unit", "conversions")
+
+    def __init__(self, number, unit, conversions=None):
         self.number = number
         self.unit = unit
+        self.conversions = conversions
     def __repr__(self):
         return self.to_string()
     def to_string(self):
@@ -61,31 +89,38 @@ class Measurement(object):
             else:
                 return "%s %ss" % (self.number, self.unit)
 
+    def base_quantity(self, conversions=None):
+        """Return the base unit of this measurement's dimension and the
+        quantity in it (e.g. ("ounce", 32) for 2 pounds), by
+        <conversions> or else the measurement's own"""
+
+        if conversions is None:
+            conversions = self.conversions or {}
+
+        base_unit, factor = conversions.get(self.unit, (self.unit, 1))
+        return (base_unit, self.number * factor)
+
+    def _keys(self, other):
+        # both sides go by the same conversions
+        conversions = self.conversions or other.conversions or {}
+        return (self.base_quantity(conversions),
+                other.base_quantity(conversions))
+
     def __lt__(self, other):
-        if self.unit == other.unit:
-            return self.number < other.number
-        else:
-            return self.unit < other.unit
+        a, b = self._keys(other)
+        return a < b
     def __gt__(self, other):
-        if self.unit == other.unit:
-            return self.number > other.number
-        else:
-            return self.unit > other.unit
+        a, b = self._keys(other)
+        return a > b
     def __eq__(self, other):
-        if self.unit == other.unit:
-            return ((self.number == other.number) and
-                    (self.unit == other.unit))
-        return False
+        a, b = self._keys(other)
+        return a == b
     def __le__(self, other):
-        if self.unit == other.unit:
-            return self.number <= other.number
-        else:
-            return self.unit <= other.unit
+        a, b = self._keys(other)
+        return a <= b
     def __ge__(self, other):
-        if self.unit == other.unit:
-            return self.number >= other.number
-        else:
-            return self.unit >= other.unit
+        a, b = self._keys(other)
+        return a >= b
     def __ne__(self, other):
         return not self.__eq__(other)
 
@@ -114,10 +149,105 @@ purchase_date = ?,
 expiration_date = ?
 where id = ?"""
 
+# SQL to add many new items with known IDs in one executemany() call
+add_many_inventory_sql = """insert into item (
+    id,
+    condition_id,
+    item,
+    weight,
+    weight_unit_id,
+    life,
+    life_unit_id,
+    record_type_id,
+    purchase_date,
+    expiration_date)
+values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"""
+
 delete_sql = "delete from item where id = ?"
 
-# SQL to return all inventory of a specific record type
-inventory_sql = """
+# the pragmas set on each connection by each storage profile.  The
+# journal mode is kept in the file itself, so a file opened in WAL mode
+# gets the "performance" profile unless another is asked for
+storage_profiles = {
+    "default": [("journal_mode", "delete"),
+                ("synchronous", "full"),
+                ("cache_size", -2000),
+                ("mmap_size", 0),
+                ("temp_store", "default")],
+    "performance": [("journal_mode", "wal"),
+                    ("synchronous", "normal"),
+                    ("cache_size", -65536), # 64 MB
+                    ("mmap_size", 268435456), # 256 MB
+                    ("temp_store", "memory")]
+}
+
+def apply_profile(conn, profile, read_only=False):
+    """Set the pragmas of the storage profile named <profile> on <conn>;
+    a read-only connection leaves the journal mode alone"""
+
+    for pragma, value in storage_profiles[profile]:
+        if read_only and pragma == "journal_mode":
+            continue
+        result = conn.execute("pragma %s = %s" % (pragma, value)).fetchall()
+
+        # SQLite reports the journal mode it ended up in rather than
+        # failing
+        if pragma == "journal_mode" and result[0][0] != value:
+            raise OperationalError("Could not set the journal mode to %s"
+                                   % value)
+
+# how many read-only connections a ReadOnlyPool keeps, and how many
+# prepared statements each of them caches
+read_pool_size = 4
+read_cached_statements = 256
+
+# SQL to find the computed goals that sql/goal.sql would change
+goal_changes_sql = """
+select g.id
+from item g
+inner join item r
+on g.recommendation_id = r.id
+where g.record_type_id = :goal and
+(g.condition_id is not r.condition_id or
+ g.item is not r.item or
+ g.weight is not cast(r.weight * :multiplier as integer) or
+ g.weight_unit_id is not r.weight_unit_id or
+ g.life is not r.life or
+ g.life_unit_id is not r.life_unit_id)"""
+
+# SQL to find the computed goals whose recommendations are gone
+goal_orphans_sql = """
+select id
+from item
+where record_type_id = :goal and
+recommendation_id is not null and
+recommendation_id not in (select id
+                          from item
+                          where record_type_id = :recommendation)"""
+
+# SQL to save a goal scenario, or change its multiplier
+save_scenario_sql = """
+insert into goal_scenario (name, multiplier)
+values (?, ?)
+on conflict (name) do update
+set multiplier = excluded.multiplier"""
+
+# how many report results to keep, and how many rows among them
+report_cache_size = 32
+report_cache_max_rows = 100000
+
+# SQL to look up the inventory on hand for a goal
+goal_coverage_sql = """
+select total_base_weight,
+first_expiration_date
+from goal_coverage
+where condition_id = ? and
+item = ? and
+base_weight_unit_id = ?"""
+
+# SQL to return inventory of a specific record type; a filter and an
+# order are added by InventoryDB.inventory_query()
+inventory_select_sql = """
 select i.id as id,
 c.description as condition,
 item as description,
@@ -126,7 +256,8 @@ wu.unit as weight_unit,
 life,
 lu.unit as life_unit,
 rt.description as record_type,
-purchase_date
+purchase_date,
+expiration_date
 from item i
 inner join condition c
 on i.condition_id = c.id
@@ -136,18 +267,220 @@ inner join unit lu
 on i.life_unit_id = lu.id
 inner join recordtype rt
 on i.record_type_id = rt.id
-where i.record_type_id = ?
+where i.record_type_id = ?"""
+
+# SQL to return all inventory of a specific record type
+inventory_sql = inventory_select_sql + """
 order by purchase_date desc"""
 
+# each word of a filter must appear in the condition or description
+inventory_filter_sql = """
+and (c.description like ? escape '\\' or i.item like ? escape '\\')"""
+
+# SQL to return the items of a specific record type that match a
+# full-text search, best match first
+search_sql = """
+select i.id as id,
+c.description as condition,
+item as description,
+weight,
+wu.unit as weight_unit,
+life,
+lu.unit as life_unit,
+rt.description as record_type,
+purchase_date,
+expiration_date
+from item_fts f
+inner join item i
+on f.rowid = i.id
+inner join condition c
+on i.condition_id = c.id
+inner join unit wu
+on i.weight_unit_id = wu.id
+inner join unit lu
+on i.life_unit_id = lu.id
+inner join recordtype rt
+on i.record_type_id = rt.id
+where item_fts match ?
+and i.record_type_id = ?
+order by f.rank, i.id"""
+
+# a full-text search as a filter on inventory_select_sql
+search_filter_sql = """
+and i.id in (select rowid from item_fts where item_fts match ?)"""
+
+# the columns to sort by for each InventoryItem attribute
+inventory_sort_columns = {"id": ["i.id"],
+                          "condition": ["c.description", "i.item"],
+                          "description": ["i.item"],
+                          "amount": ["(select unit from unit " +
+                                     "where id = i.base_weight_unit_id)",
+                                     "base_weight"],
+                          "life": ["(select unit from unit " +
+                                   "where id = i.base_life_unit_id)",
+                                   "base_life"],
+                          "purchase_date": ["purchase_date"],
+                          "expiration_date": ["expiration_date"]}
+
+# the same, sorting lookup values by ID, which lets the item indexes
+# supply the order; only right when the IDs sort like the names
+inventory_id_sort_columns = {"condition": ["i.condition_id", "i.item"],
+                             "amount": ["base_weight_unit_id", "base_weight"],
+                             "life": ["base_life_unit_id", "base_life"]}
+
+def fts_query(text):
+    """Return an FTS5 query matching items with a word starting with
+    each word of <text>"""
+
+    # quote each word so punctuation and FTS5 keywords are taken
+    # literally
+    return " ".join(['"%s"*' % word.replace('"', '""')
+                     for word in text.split()])
+
+def fts_tokens(text):
+    """Split <text> into words the way the full-text index does
+    (lowercased, without accents, on anything not a letter or digit)"""
+
+    text = "".join([ch
+                    for ch in unicodedata.normalize("NFKD", text.lower())
+                    if not unicodedata.combining(ch)])
+    return re.findall(r"[^\W_]+", text)
+
+def item_matches(item, text):
+    """Return True if <item> would be found by searching for <text> (see
+    fts_query()), without asking the database"""
+
+    columns = [fts_tokens(item.description),
+               fts_tokens(item.condition)]
+
+    def phrase_in(phrase, tokens):
+        # all but the last word must match exactly, the last as a prefix
+        for start in range(len(tokens) - len(phrase) + 1):
+            if (tokens[start:start + len(phrase) - 1] == phrase[:-1] and
+                tokens[start + len(phrase) - 1].startswith(phrase[-1])):
+                return True
+        return False
+
+    for word in text.split():
+        phrase = fts_tokens(word)
+        if phrase and not any([phrase_in(phrase, tokens)
+                               for tokens in columns]):
+            return False
+
+    return True
+
+def parse_date(text):
+    """Return the datetime for a date read from the database; dates are
+    stored in ISO format (see format_date()), which is read directly,
+    and anything else is left to dateutil"""
+
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError: # free-form dates from older files
+        return parse(text)
+
+def format_date(date):
+    """Return a datetime in the ISO format dates are stored in"""
+
+    if date is None:
+        return None
+
+    return date.isoformat(" ")
+
+def calculate_expiration(purchase_date, life, unit):
+    """Return the expiration date of something bought on <purchase_date>
+    that keeps for <life> <unit>s (year, month or day)"""
+
+    # can't if we don't know when it was bought
+    if not purchase_date:
+        return None
+
+    if unit == "year":
+        return datetime(purchase_date.year + life,
+                        purchase_date.month,
+                        purchase_date.day)
+    elif unit == "month":
+        years = math.floor(life / 12) + purchase_date.year
+        months = life % 12 + purchase_date.month
+
+        while months > 12:
+            years += 1
+            months -= 12
+
+        return datetime(years,
+                        months,
+                        purchase_date.day)
+
+    elif unit == "day":
+        return purchase_date + timedelta(life)
+
+class ChangeEvent(object):
+    """Describes rows of one record type that an InventoryDB inserted,
+    updated or deleted; <action> is "insert", "update" or "delete" and
+    <ids> the IDs of the rows.  An "external" event, with no record type
+    or IDs, means another program changed the file in ways unknown."""
+
+    __slots__ = ("action", "record_type", "ids")
+
+    def __init__(self, action, record_type, ids):
+        self.action = action
+        self.record_type = record_type
+        self.ids = ids
+
+    def __repr__(self):
+        return "ChangeEvent(%r, %r, %r)" % (self.action,
+                                            self.record_type,
+                                            self.ids)
+
+def goal_label(goal):
+    """Return the text to show for <goal> in a list of goals"""
+    if goal.condition == "":
+        dsc = goal.description
+    else:
+        dsc = "%s (%s)" % (goal.description, goal.condition)
+
+    return dsc + ", " + goal.amount.to_string()
+
+class GoalCatalog(object):
+    """All the goals of a file, sorted for display, with their labels and
+    an index from (description, condition) to their position"""
+    def __init__(self, goals):
+        goals.sort(key=lambda g: "%s (%s)" % (g.description, g.condition))
+
+        self.goals = goals
+        self.labels = [goal_label(goal) for goal in goals]
+
+        self.index = {}
+        for i, goal in enumerate(goals):
+            self.index.setdefault((goal.description, goal.condition), i)
+
+    def __len__(self):
+        return len(self.goals)
+
+    def find(self, item):
+        """Return the position of the goal <item> fills, or None"""
+        return self.index.get((item.description, item.condition))
+
 class InventoryItem(object):
     """Represents an item of inventory (or a goal, or a ration recommendation)"""
+
+    # there can be a great many of these, so don't give each a __dict__
+    __slots__ = ("id",
+                 "condition",
+                 "description",
+                 "amount",
+                 "_life",
+                 "_purchase_date",
+                 "_expiration_date")
+
     def __init__(self,
                  id,
                  condition,
                  description,
                  amount,
                  life,
-                 purchase_date):
+                 purchase_date,
+                 expiration_date=None):
 
         self.id = id
 
@@ -155,12 +488,37 @@ class InventoryItem(object):
         self.description = description
         self.amount = amount
         self.life = life
+        self.purchase_date = purchase_date
+
+        # a stored expiration date is taken as it is; setting the life
+        # or purchase date clears it
+        if type(expiration_date) == str:
+            self._expiration_date = parse_date(expiration_date)
+        else:
+            self._expiration_date = expiration_date
+
+    @property
+    def purchase_date(self):
+        return self._purchase_date
 
+    @purchase_date.setter
+    def purchase_date(self, purchase_date):
         # make sure the purchase date is an actual datetime
         if type(purchase_date) == str:
-            self.purchase_date = parse(purchase_date)
+            self._purchase_date = parse_date(purchase_date)
         else:
-            self.purchase_date = purchase_date
+            self._purchase_date = purchase_date
+
+        self._expiration_date = None
+
+    @property
+    def life(self):
+        return self._life
+
+    @life.setter
+    def life(self, life):
+        self._life = life
+        self._expiration_date = None
 
     def clone(self, as_type="inventory"):
         """Copy this item to a new one with no ID as a specified type.  TODO:
@@ -177,31 +535,22 @@ class InventoryItem(object):
     
     @property
     def expiration_date(self):
-        """Return the expiration date calculated from the purchase date and
-        the item's life"""
+        """Return the stored expiration date, or calculate it if there
+        isn't one"""
 
-        # can't if we don't know when it was bought
-        if not self.purchase_date:
-            return None
+        if self._expiration_date is None:
+            self._expiration_date = self.calculate_expiration_date()
 
-        if self.life.unit == "year":
-            return datetime(self.purchase_date.year + self.life.number,
-                            self.purchase_date.month,
-                            self.purchase_date.day)
-        elif self.life.unit == "month":
-            years = math.floor(self.life.number / 12) + self.purchase_date.year
-            months = self.life.number % 12 + self.purchase_date.month
+        return self._expiration_date
 
-            while months > 12:
-                years += 1
-                months -= 12
+    def calculate_expiration_date(self):
+        """Return the expiration date calculated from the purchase date and
+        the item's life"""
 
-            return datetime(years,
-                            months,
-                            self.purchase_date.day)
+        return calculate_expiration(self.purchase_date,
+                                    self.life.number,
+                                    self.life.unit)
 
-        elif self.life.unit == "day":
-            return self.purchase_date + timedelta(self.life.number)
     def to_string(self):
         if self.condition.strip() != "":
             return "%s (%s), %s" % (self.description,
@@ -211,12 +560,281 @@ class InventoryItem(object):
             return "%s, %s" % (self.description,
                                self.amount.to_string())
 
-        
+
+# SQL returning the stored expiration dates of a record type, with days
+# left and whether that is no more than the days parameter
+expirations_sql = """
+select id,
+expiration_date,
+cast(julianday(date(expiration_date)) - julianday(?) as integer),
+julianday(date(expiration_date)) - julianday(?) <= ?
+from item
+where record_type_id = ?
+order by id"""
+
+def expiration_dates(purchase_dates, lives, within_days=0, today=None):
+    """Work out the expiration dates of many items at once from lists of
+    purchase dates and life Measurements; return lists of the
+    expiration dates, the days left until each from <today> (default
+    today), and whether each expires within <within_days> days.  Each
+    date is what InventoryItem.expiration_date would calculate, or None
+    where that has no date or would fail.
+
+    This isn't vectorized: it is a Python loop, quick only because each
+    distinct (purchase date, life) is worked out once, which helps most
+    where many items were bought together."""
+
+    if today is None:
+        today = datetime.today()
+    today = datetime(today.year, today.month, today.day)
+
+    # items bought together with the same life share a result, so only
+    # work out each distinct combination once
+    distinct = {}
+    positions = []
+    for purchase_date, life in zip(purchase_dates, lives):
+        key = (purchase_date, life.number, life.unit)
+        position = distinct.get(key)
+        if position is None:
+            position = distinct[key] = len(distinct)
+        positions.append(position)
+
+    dates = []
+    days_left = []
+    expiring = []
+    for purchase_date, number, unit in distinct:
+        try:
+            date = calculate_expiration(purchase_date, number, unit)
+        except ValueError: # e.g. a month without the purchase day
+            date = None
+
+        if date is None:
+            dates.append(None)
+            days_left.append(None)
+            expiring.append(None)
+        else:
+            days = (datetime(date.year, date.month, date.day) - today).days
+            dates.append(date)
+            days_left.append(days)
+            expiring.append(days <= within_days)
+
+    return ([dates[n] for n in positions],
+            [days_left[n] for n in positions],
+            [expiring[n] for n in positions])
+
+def item_from_dict(dic):
+    """Build a new InventoryItem from a dict (e.g. a row of an import file)
+    with the keys condition, description, amount, amount_unit, life,
+    life_unit and (optionally) purchase_date"""
+
+    purchase_date = dic.get("purchase_date") or None
+
+    return InventoryItem(None,
+                         dic.get("condition") or "",
+                         dic["description"],
+                         Measurement(int(dic["amount"]), dic["amount_unit"]),
+                         Measurement(int(dic["life"]), dic["life_unit"]),
+                         purchase_date)
+
+# (number, sql) for each script in sql/migrations, read on first use
+_migrations = None
+
+def migrations():
+    """Return the list of (number, sql) schema migrations in order"""
+    global _migrations
+
+    if _migrations is None:
+        _migrations = []
+        for filename in sorted(glob("sql/migrations/*.sql")):
+            number = int(os.path.basename(filename).split("-")[0])
+            with codecs.open(filename, "r", "utf-8") as f:
+                _migrations.append((number, f.read()))
+
+    return _migrations
+
+def schema_version():
+    """Return the schema version a fully migrated file has"""
+    all_migrations = migrations()
+
+    if all_migrations:
+        return all_migrations[-1][0]
+    else:
+        return 0
+
+def split_script(sql):
+    """Split the SQL script <sql> into its statements; a semicolon in a
+    string or a trigger body doesn't end one"""
+
+    statements = []
+    statement = ""
+
+    for part in sql.split(";"):
+        statement += part
+        if complete_statement(statement + ";"):
+            if statement.strip() != "":
+                statements.append(statement + ";")
+            statement = ""
+        else:
+            statement += ";"
+
+    # anything after the last semicolon
+    if statement.strip() != "":
+        statements.append(statement)
+
+    return statements
+
+def migrate(conn):
+    """Apply each migration newer than the schema version of the database
+    on <conn> (kept in PRAGMA user_version); return the number applied.
+    Safe to run from several connections to the same file at once."""
+
+    cur = conn.cursor()
+    cur.execute("pragma user_version")
+    version = cur.fetchone()[0]
+
+    # the usual case: the file is already current
+    if version >= schema_version():
+        return 0
+
+    applied = 0
+
+    for number, sql in migrations():
+        if number <= version:
+            continue
+
+        # take the write lock, then look again: another connection may
+        # have applied the migration since the version was read
+        cur.execute("begin immediate")
+        try:
+            cur.execute("pragma user_version")
+            version = cur.fetchone()[0]
+
+            # the script and the version bump succeed or fail together
+            if number > version:
+                for statement in split_script(sql):
+                    cur.execute(statement)
+                cur.execute("pragma user_version = %d" % number)
+                applied += 1
+        except:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+    return applied
+
+def migrate_file(path):
+    """Migrate an existing .qm file; return its path and the number of
+    migrations applied"""
+
+    conn = connect(path)
+    try:
+        return path, migrate(conn)
+    finally:
+        conn.close()
+
+
+class ReadOnlyPool(object):
+    """A small pool of read-only connections to a database file, shared
+    between threads; each connection is used by one thread at a time"""
+    def __init__(self, path, profile="default", size=read_pool_size):
+        uri = Path(path).resolve().as_uri() + "?mode=ro"
+
+        self._idle = []
+        self._closed = False
+        self._available = threading.Condition()
+
+        for i in range(size):
+            conn = connect(uri,
+                           uri=True,
+                           check_same_thread=False,
+                           cached_statements=read_cached_statements)
+            conn.execute("pragma query_only = 1")
+            apply_profile(conn, profile, read_only=True)
+            self._idle.append(conn)
+
+        # one more connection, used only to watch for changes; since it
+        # never writes, its PRAGMA data_version changes with every
+        # commit to the file
+        self._watcher = connect(uri, uri=True, check_same_thread=False)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the with block, waiting for one if
+        all of them are in use"""
+
+        with self._available:
+            while not self._closed and not self._idle:
+                self._available.wait()
+
+            if self._closed:
+                raise ValueError("The connection pool is closed")
+
+            conn = self._idle.pop()
+
+        try:
+            yield conn
+        finally:
+            # end any transaction the borrower left open
+            if conn.in_transaction:
+                conn.rollback()
+
+            with self._available:
+                if self._closed:
+                    conn.close()
+                else:
+                    self._idle.append(conn)
+                self._available.notify()
+
+    def data_version(self):
+        """Return a number that changes whenever the file is changed by
+        any connection"""
+
+        with self._available:
+            return self._watcher.execute(
+                "pragma data_version").fetchone()[0]
+
+    def close(self):
+        """Close every connection; those in use are closed when they are
+        given back"""
+
+        with self._available:
+            self._closed = True
+            self._watcher.close()
+            for conn in self._idle:
+                conn.close()
+            self._idle = []
+            self._available.notify_all()
+
+
 class InventoryDB(object):
     """Manages storage of inventory, goal, and recommendation records"""
-    def __init__(self, path):
+    def __init__(self, path, profile=None):
 
         self.filename = path
+
+        # how many transaction() blocks we are inside; writes only
+        # commit when this is zero
+        self._tx_depth = 0
+
+        # whether anything has been committed on this connection
+        self._committed = False
+
+        # functions to call with each ChangeEvent, and the events of the
+        # current transaction, which are only sent once it commits
+        self._listeners = []
+        self._pending_events = []
+
+
+        # report results by SQL, most recently used last, with the
+        # data version each was read at; see iter_report()
+        self._report_cache = OrderedDict()
+        self._report_cache_rows = 0
+        self._report_cache_lock = threading.Lock()
+
+        # the data version at which each report was found too big to
+        # cache, so it isn't read to the end again for nothing
+        self._report_too_big = OrderedDict()
         
         # read the SQL to create a database
         with codecs.open("sql/create-db.sql", "r", "utf-8") as f:
@@ -236,11 +854,41 @@ class InventoryDB(object):
             self.cur.executescript(self.create_sql)
             self.conn.commit()
 
+        # bring older files (and the one just created) up to date
+        migrate(self.conn)
+
+        # use the storage profile asked for, or the one the file was
+        # last given
+        if profile is None:
+            self.cur.execute("pragma journal_mode")
+            if self.cur.fetchone()[0] == "wal":
+                profile = "performance"
+            else:
+                profile = "default"
+        self.profile = profile
+        apply_profile(self.conn, profile)
+
+        # the GoalCatalog, built when first asked for and dropped when
+        # the goals change
+        self._goal_catalog = None
+
+        # PRAGMA data_version as poll_changes() last saw it
+        self.cur.execute("pragma data_version")
+        self._data_version = self.cur.fetchone()[0]
+
+        # reports run on their own read-only connections, opened when
+        # first needed
+        self._read_pool = None
+        self._read_pool_lock = threading.Lock()
+
         # cache some invariable data
         self.record_types = {}
         self.cur.execute("select id, description from recordtype")
         for row in self.cur.fetchall():
             self.record_types[row[1]] = row[0]
+        self.record_type_names = dict((id, name)
+                                      for name, id
+                                      in self.record_types.items())
 
         self.conditions = {}
         self.cur.execute("select id, description from condition")
@@ -257,22 +905,254 @@ class InventoryDB(object):
         for row in self.cur.fetchall():
             self.durations[row[1]] = row[0]
 
+        # how to convert each unit to the base unit of its dimension
+        self.conversions = {}
+        self.cur.execute(unit_conversions_sql)
+        for row in self.cur.fetchall():
+            self.conversions[row[0]] = (row[1], row[2])
+
         self.ration_multipliers = {}
         self.cur.execute("select description, multiplier from ration_multipliers")
         for row in self.cur.fetchall():
             self.ration_multipliers[row[0]] = row[1]
 
-    def set_goals(self, mult):
+        # the stock lookup tables are numbered alphabetically, so most
+        # sorts can follow an index
+        self.sort_columns = dict(inventory_sort_columns)
+        for attrib, lookup in [("condition", self.conditions),
+                               ("amount", self.amounts),
+                               ("life", self.durations)]:
+            if sorted(lookup, key=lookup.get) == sorted(lookup):
+                self.sort_columns[attrib] = inventory_id_sort_columns[attrib]
+
+    @property
+    def read_pool(self):
+        """The pool of read-only connections reports are run on"""
+        with self._read_pool_lock:
+            if self._read_pool is None:
+                self._read_pool = ReadOnlyPool(self.filename, self.profile)
+            return self._read_pool
+
+    def _close_read_pool(self):
+        with self._read_pool_lock:
+            if self._read_pool:
+                self._read_pool.close()
+                self._read_pool = None
+
+                # a new pool counts data versions afresh
+                with self._report_cache_lock:
+                    self._report_cache.clear()
+                    self._report_cache_rows = 0
+                    self._report_too_big.clear()
+
+    def set_profile(self, profile):
+        """Switch to the storage profile named <profile>; the choice is
+        kept with the file"""
+
+        # the journal mode can't change while other connections are open
+        self._close_read_pool()
+
+        apply_profile(self.conn, profile)
+        self.profile = profile
+
+    def add_listener(self, listener):
+        """Call <listener> with a ChangeEvent for every change this
+        InventoryDB commits"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _publish(self, action, record_type, ids):
+        """Queue a ChangeEvent, to be sent when the current transaction
+        commits"""
+        self._pending_events.append(ChangeEvent(action, record_type,
+                                                list(ids)))
+
+    def _invalidate(self, events):
+        """Drop whatever cached data <events> make out of date"""
+        for event in events:
+            if event.record_type in ("goal", None):
+                self._goal_catalog = None
+
+    def goal_catalog(self):
+        """Return the GoalCatalog of this file's goals"""
+        if self._goal_catalog is None:
+            self._goal_catalog = GoalCatalog(self.all_inventory("goal"))
+        return self._goal_catalog
+
+    def poll_changes(self):
+        """Send an "external" ChangeEvent if another connection has
+        changed the file since the last call (or since it was opened);
+        return whether one had"""
+
+        # our own commits don't change PRAGMA data_version, and a
+        # transaction in progress will have its own events
+        if self._tx_depth > 0:
+            return False
+
+        # this only sees commits made since the connection's read
+        # transaction began, so nothing may leave a query half-read on
+        # it; the table reads pages with inventory_page() for that reason
+        self.cur.execute("pragma data_version")
+        version = self.cur.fetchone()[0]
+        changed = version != self._data_version
+        self._data_version = version
+
+        if changed:
+            event = ChangeEvent("external", None, [])
+            self._invalidate([event])
+            for listener in list(self._listeners):
+                listener(event)
+
+        return changed
+
+    def _send_events(self):
+        events = self._pending_events
+        self._pending_events = []
+
+        self._invalidate(events)
+
+        # a listener may remove itself
+        for event in events:
+            for listener in list(self._listeners):
+                listener(event)
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """Group writes into a single unit of work: everything inside
+        the with block is committed once at the end, or rolled back if
+        an exception escapes.  Nested blocks use savepoints, so an inner
+        failure only undoes the inner block's work.  If <immediate>, the
+        outermost block takes the write lock at once."""
+
+        if self._tx_depth == 0:
+            # finish anything the sqlite3 module started implicitly
+            if self.conn.in_transaction:
+                self.conn.commit()
+            self.cur.execute("begin immediate" if immediate else "begin")
+            self._tx_depth += 1
+            try:
+                yield self
+            except:
+                self._tx_depth -= 1
+                self.conn.rollback()
+
+                # a cache filled inside the transaction saw its changes
+                self._invalidate(self._pending_events)
+                self._pending_events = []
+                raise
+            else:
+                self._tx_depth -= 1
+                self.conn.commit()
+                self._committed = True
+                self._send_events()
+        else:
+            savepoint = "qm_%d" % self._tx_depth
+            self.cur.execute("savepoint %s" % savepoint)
+            self._tx_depth += 1
+            events = len(self._pending_events)
+            try:
+                yield self
+            except:
+                self._tx_depth -= 1
+                self.cur.execute("rollback to %s" % savepoint)
+                self.cur.execute("release %s" % savepoint)
+                self._invalidate(self._pending_events[events:])
+                del self._pending_events[events:]
+                raise
+            else:
+                self._tx_depth -= 1
+                self.cur.execute("release %s" % savepoint)
+
+    def set_goals(self, mult, scenario=None):
         """Set goals by multiplying the recommendation for an adult male by
-        <mult>"""
+        <mult>, saving them as the scenario named <scenario> if given"""
+
+        with self.transaction(immediate=True):
+            if scenario:
+                self.cur.execute(save_scenario_sql, (scenario, mult))
+            self.cur.execute("update goal_scenario " +
+                             "set active = (name is ?)",
+                             (scenario,))
+            self._plan_goals(mult)
+
+    def _plan_goals(self, mult):
+        """Bring the goals computed from recommendations up to date with
+        <mult>, writing only the ones that change; goals added by hand
+        are left alone"""
+
+        params = {"goal": self.record_types["goal"],
+                  "recommendation": self.record_types["recommendation"],
+                  "multiplier": mult}
+
+        # the goals are read before they are written, so take the write
+        # lock before another program can commit in between
+        with self.transaction(immediate=True):
+            self.cur.execute(goal_changes_sql, params)
+            changed_ids = [row[0] for row in self.cur.fetchall()]
+
+            self.cur.execute(goal_orphans_sql, params)
+            orphan_ids = [row[0] for row in self.cur.fetchall()]
+
+            # new goals get IDs past the highest
+            self.cur.execute("select ifnull(max(id), 0) from item")
+            last_id = self.cur.fetchone()[0]
+
+            self.cur.execute(self.goal_sql, params)
+
+            self.cur.executemany(delete_sql, [(id,) for id in orphan_ids])
 
-        # remove any existing goals
-        self.cur.execute("delete from item where record_type_id = ?",
-                         (self.record_types["goal"],))
+            self.cur.execute("select id from item " +
+                             "where record_type_id = ? and id > ?",
+                             (params["goal"], last_id))
+            new_ids = [row[0] for row in self.cur.fetchall()]
 
-        # create new ones
-        self.cur.execute(self.goal_sql, (mult,))
-        self.conn.commit()
+            if orphan_ids:
+                self._publish("delete", "goal", orphan_ids)
+            if changed_ids:
+                self._publish("update", "goal", changed_ids)
+            if new_ids:
+                self._publish("insert", "goal", new_ids)
+
+    def scenarios(self):
+        """Return (name, multiplier, active) for each saved goal scenario,
+        by name"""
+        self.cur.execute("select name, multiplier, active " +
+                         "from goal_scenario " +
+                         "order by name")
+        return [(row[0], row[1], bool(row[2]))
+                for row in self.cur.fetchall()]
+
+    def active_scenario(self):
+        """Return the name of the goal scenario in use, or None"""
+        self.cur.execute("select name from goal_scenario where active")
+        row = self.cur.fetchone()
+        return row[0] if row else None
+
+    def use_scenario(self, name):
+        """Switch the goals to the saved scenario <name>; only the goals
+        whose amounts differ are written"""
+
+        with self.transaction(immediate=True):
+            self.cur.execute("select multiplier from goal_scenario " +
+                             "where name = ?",
+                             (name,))
+            row = self.cur.fetchone()
+            if row is None:
+                raise KeyError(name)
+
+            self.cur.execute("update goal_scenario " +
+                             "set active = (name = ?)",
+                             (name,))
+            self._plan_goals(row[0])
+
+    def delete_scenario(self, name):
+        """Forget the saved scenario <name>; the goals stay as they are"""
+        with self.transaction():
+            self.cur.execute("delete from goal_scenario where name = ?",
+                             (name,))
 
     def save_inventory(self, item):
         """Save an altered inventory item to the database"""
@@ -281,18 +1161,29 @@ class InventoryDB(object):
         amount, amount_id = item.amount.number, self.amounts[item.amount.unit]
         life, life_id = item.life.number, self.durations[item.life.unit]
         condition_id = self.conditions[item.condition]
-        
-        self.cur.execute(save_inventory_sql,
-                         (condition_id,
-                          item.description,
-                          amount,
-                          amount_id,
-                          life,
-                          life_id,
-                          item.purchase_date,
-                          item.expiration_date,
-                          item.id))
-        self.conn.commit()
+
+        # the record type is read first, so take the write lock before
+        # another program can commit in between
+        with self.transaction(immediate=True):
+            record_type = self._record_type_of(item.id)
+            self.cur.execute(save_inventory_sql,
+                             (condition_id,
+                              item.description,
+                              amount,
+                              amount_id,
+                              life,
+                              life_id,
+                              format_date(item.purchase_date),
+                              format_date(item.expiration_date),
+                              item.id))
+            self._publish("update", record_type, [item.id])
+
+    def _record_type_of(self, id):
+        """Return the name of the record type of the item with ID <id>"""
+        self.cur.execute("select record_type_id from item where id = ?",
+                         (id,))
+        row = self.cur.fetchone()
+        return self.record_type_names[row[0]] if row else None
 
     def add_inventory(self, item, record_type="inventory"):
         """Save a new inventory item to the database"""
@@ -302,69 +1193,623 @@ class InventoryDB(object):
         life, life_id = item.life.number, self.durations[item.life.unit]
         rec_type_id = self.record_types[record_type]
         condition_id = self.conditions[item.condition]
-        
-        self.cur.execute(add_inventory_sql,
-                         (condition_id,
-                          item.description,
-                          amount,
-                          amount_id,
-                          life,
-                          life_id,
-                          rec_type_id,
-                          item.purchase_date,
-                          item.expiration_date))
-        self.conn.commit()
-
-        # update the item's ID with the new row ID
-        item.id = self.cur.lastrowid
+
+        with self.transaction():
+            self.cur.execute(add_inventory_sql,
+                             (condition_id,
+                              item.description,
+                              amount,
+                              amount_id,
+                              life,
+                              life_id,
+                              rec_type_id,
+                              format_date(item.purchase_date),
+                              format_date(item.expiration_date)))
+
+            # update the item's ID with the new row ID
+            item.id = self.cur.lastrowid
+            self._publish("insert", record_type, [item.id])
+
+    def add_inventory_many(self, items, record_type="inventory",
+                           batch_size=5000):
+        """Save many new items to the database in a single transaction;
+        set the ID of each item and return the list of new IDs"""
+
+        rec_type_id = self.record_types[record_type]
+
+        # look the caches up once rather than once per item
+        amounts = self.amounts
+        durations = self.durations
+        conditions = self.conditions
+
+        ids = []
+        batch = []
+
+        def flush():
+            self.cur.executemany(add_many_inventory_sql, batch)
+            del batch[:]
+
+        # take the write lock before reading the highest ID so nobody
+        # can insert under us, then number the new rows ourselves;
+        # executemany() doesn't report row IDs
+        with self.transaction(immediate=True):
+            self.cur.execute("select ifnull(max(id), 0) from item")
+            next_id = self.cur.fetchone()[0] + 1
+
+            for item in items:
+                batch.append((next_id,
+                              conditions[item.condition],
+                              item.description,
+                              item.amount.number,
+                              amounts[item.amount.unit],
+                              item.life.number,
+                              durations[item.life.unit],
+                              rec_type_id,
+                              format_date(item.purchase_date),
+                              format_date(item.expiration_date)))
+                item.id = next_id
+                ids.append(next_id)
+                next_id += 1
+
+                if len(batch) >= batch_size:
+                    flush()
+
+            if batch:
+                flush()
+
+            self._publish("insert", record_type, ids)
+
+        return ids
+
+    def import_file(self, filename, record_type="inventory"):
+        """Import items from a .csv or .jsonl file in a single
+        transaction and return the list of new IDs"""
+
+        if filename.lower().endswith(".csv"):
+            with codecs.open(filename, "r", "utf-8") as f:
+                return self.add_inventory_many(
+                    map(item_from_dict, csv.DictReader(f)),
+                    record_type)
+        elif filename.lower().endswith(".jsonl"):
+            with codecs.open(filename, "r", "utf-8") as f:
+                return self.add_inventory_many(
+                    (item_from_dict(json.loads(line))
+                     for line in f
+                     if line.strip() != ""),
+                    record_type)
+        else:
+            raise ValueError("Can't import %s: expected a .csv or .jsonl file"
+                             % filename)
+
+    def inventory_query(self, record_type=None, filter=None, sort=None,
+                        descending=False):
+        """Return the SQL and parameters to select the items of the
+        specified type (or "inventory" if not specified) whose condition
+        or description contains every word of <filter>, ordered by the
+        InventoryItem attribute <sort> (or newest purchase first)"""
+
+        if not record_type:
+            record_type = "inventory"
+
+        sql = [inventory_select_sql]
+        params = [self.record_types[record_type]]
+
+        if filter:
+            for word in filter.split():
+                # match the word literally, not as a LIKE pattern
+                pattern = "%%%s%%" % (word.replace("\\", "\\\\")
+                                      .replace("%", "\\%")
+                                      .replace("_", "\\_"))
+                sql.append(inventory_filter_sql)
+                params += [pattern, pattern]
+
+        sql.append(self._order_sql(sort, descending))
+
+        return "".join(sql), params
+
+    def _order_columns(self, sort, descending):
+        """Return the expressions that order items by the InventoryItem
+        attribute <sort> (or newest purchase first), ending with the ID,
+        and whether they are descending"""
+
+        if sort:
+            return self.sort_columns[sort] + ["i.id"], descending
+        else:
+            return ["purchase_date", "i.id"], True
+
+    def _order_sql(self, sort, descending):
+        """Return the order by clause for the InventoryItem attribute
+        <sort> (or newest purchase first)"""
+
+        columns, descending = self._order_columns(sort, descending)
+        direction = " desc" if descending else ""
+
+        return "\norder by " + ", ".join([column + direction
+                                          for column in columns])
+
+    def search(self, text, record_type=None, sort=None, descending=False,
+               batch_size=500, conn=None):
+        """Yield the items of the specified type (or "inventory" if not
+        specified) with a word in the condition or description starting
+        with each word of <text>, best match first unless sorted by the
+        InventoryItem attribute <sort>; uses the full-text index.  The
+        query runs on <conn> if given (e.g. one of the read_pool's)."""
+
+        if text.strip() == "": # everything matches
+            return self.iter_inventory(record_type, None, sort, descending,
+                                       batch_size, conn)
+
+        sql, params = self.search_query(text, record_type, sort, descending)
+
+        return self._iter_items(sql, params, batch_size, conn)
+
+    def search_query(self, text, record_type=None, sort=None,
+                     descending=False):
+        """Return the SQL and parameters for search() to find <text>"""
+
+        if not record_type:
+            record_type = "inventory"
+
+        record_type_id = self.record_types[record_type]
+
+        if sort:
+            sql = (inventory_select_sql +
+                   search_filter_sql +
+                   self._order_sql(sort, descending))
+            params = (record_type_id, fts_query(text))
+        else:
+            sql = search_sql
+            params = (fts_query(text), record_type_id)
+
+        return sql, params
+
+    def inventory_page(self, record_type=None, sort=None, descending=False,
+                       after=None, limit=500):
+        """Return up to <limit> items of the specified type (or "inventory"
+        if not specified), sorted as by inventory_query(), that come after
+        the item with ID <after> (or from the first if None); raise
+        KeyError if that item is gone.
+
+        A page is found from the sort values of the row before it rather
+        than by counting rows from the top, so one deep in a big
+        inventory costs no more than the first, and it sees any writes
+        made since.  The queries run to the end, so no statement is left
+        open between pages to keep other programs from writing the
+        file."""
+
+        if not record_type:
+            record_type = "inventory"
+
+        select = inventory_select_sql + "\nand (%s)"
+        order = self._order_sql(sort, descending) + "\nlimit ?"
+        record_type_id = self.record_types[record_type]
+
+        if after is None:
+            return list(self._iter_items(select % "1" + order,
+                                         [record_type_id, limit],
+                                         limit))
+
+        columns, desc = self._order_columns(sort, descending)
+        values = self._sort_values(columns, after)
+        lead, value = columns[0], values[0]
+        rest_sql, rest_params = self._after_sql(columns[1:], values[1:],
+                                                desc)
+
+        # the rows after <after> with the same first sort value, then the
+        # rest.  SQLite puts nulls first, so a descending order puts them
+        # last; rows with and without a first sort value are read
+        # separately so that each query can follow an index.
+        if value is None:
+            parts = [("%s is null and %s" % (lead, rest_sql), rest_params)]
+            if not desc:
+                parts.append(("%s is not null" % lead, []))
+        else:
+            parts = [("%s %s ? and (%s %s ? or (%s = ? and %s))" %
+                      (lead, "<=" if desc else ">=",
+                       lead, "<" if desc else ">",
+                       lead, rest_sql),
+                      [value, value, value] + rest_params)]
+            if desc:
+                parts.append(("%s is null" % lead, []))
+
+        items = []
+        for where, params in parts:
+            items.extend(self._iter_items(select % where + order,
+                                          [record_type_id] + params +
+                                          [limit - len(items)],
+                                          limit))
+            if len(items) >= limit:
+                break
+
+        return items
+
+    def _sort_values(self, columns, id):
+        """Return the values of the sort expressions <columns> (see
+        _order_columns()) for the item with ID <id>"""
+
+        self.cur.execute("select %s\n" % ", ".join(columns) +
+                         "from item i\n" +
+                         "inner join condition c\n" +
+                         "on i.condition_id = c.id\n" +
+                         "where i.id = ?",
+                         (id,))
+        row = self.cur.fetchone()
+
+        if row is None:
+            raise KeyError(id)
+
+        return list(row)
+
+    def _after_sql(self, columns, values, descending):
+        """Return SQL and parameters matching the rows that sort after
+        those whose sort expressions <columns> have <values>"""
+
+        terms = []
+        params = []
+
+        for n, (column, value) in enumerate(zip(columns, values)):
+            # nulls sort first
+            if value is None:
+                if descending:
+                    continue
+                after, after_params = "%s is not null" % column, []
+            elif descending:
+                after = "(%s < ? or %s is null)" % (column, column)
+                after_params = [value]
+            else:
+                after, after_params = "%s > ?" % column, [value]
+
+            terms.append(" and ".join(["%s is ?" % earlier
+                                       for earlier in columns[:n]] +
+                                      [after]))
+            params += values[:n] + after_params
+
+        return "(%s)" % " or ".join(terms), params
+
+    def iter_inventory(self, record_type=None, filter=None, sort=None,
+                       descending=False, batch_size=500, conn=None):
+        """Yield the items of the specified type (or "inventory" if not
+        specified), filtered and sorted as by inventory_query(), one at
+        a time, reading <batch_size> rows from the database at a time,
+        on <conn> if given"""
+
+        sql, params = self.inventory_query(record_type, filter, sort,
+                                           descending)
+
+        return self._iter_items(sql, params, batch_size, conn)
+
+    def _iter_items(self, sql, params, batch_size, conn=None):
+        """Run a query returning the columns of inventory_select_sql on
+        <conn> (or this InventoryDB's connection) and yield an
+        InventoryItem for each row"""
+
+        # rows share their conditions, measurements and dates rather
+        # than each having its own copy
+        conditions = {}
+        measurements = {}
+        dates = {}
+
+        # use a cursor of our own so other queries can run while the
+        # caller is still consuming this one
+        cur = (conn or self.conn).cursor()
+        cur.execute(sql, params)
+
+        try:
+            rows = cur.fetchmany(batch_size)
+
+            while rows:
+                for row in rows:
+                    (id,
+                     condition,
+                     description,
+                     amount,
+                     amount_unit,
+                     life,
+                     life_unit,
+                     record_type,
+                     purchase_date,
+                     expiration_date) = row
+
+                    condition = conditions.setdefault(condition, condition)
+
+                    key = (amount, amount_unit)
+                    amount = measurements.get(key)
+                    if amount is None:
+                        amount = measurements[key] = Measurement(
+                            *key, conversions=self.conversions)
+
+                    key = (life, life_unit)
+                    life = measurements.get(key)
+                    if life is None:
+                        life = measurements[key] = Measurement(
+                            *key, conversions=self.conversions)
+
+                    if purchase_date is not None:
+                        date = dates.get(purchase_date)
+                        if date is None:
+                            date = dates[purchase_date] = parse_date(
+                                purchase_date)
+                        purchase_date = date
+
+                    if expiration_date is not None:
+                        date = dates.get(expiration_date)
+                        if date is None:
+                            date = dates[expiration_date] = parse_date(
+                                expiration_date)
+                        expiration_date = date
+
+                    yield InventoryItem(id, condition, description,
+                                        amount, life, purchase_date,
+                                        expiration_date)
+
+                rows = cur.fetchmany(batch_size)
+        finally:
+            cur.close()
+
+    def get_items(self, ids, record_type=None):
+        """Return the items of the specified type (or "inventory" if not
+        specified) with the IDs <ids>, in no particular order"""
+
+        if not record_type:
+            record_type = "inventory"
+
+        record_type_id = self.record_types[record_type]
+        ids = list(ids)
+        items = []
+
+        # stay well inside SQLite's limit on parameters
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            sql = (inventory_select_sql +
+                   "\nand i.id in (%s)" % ", ".join(["?"] * len(chunk)))
+            items.extend(self._iter_items(sql,
+                                          [record_type_id] + chunk,
+                                          500))
+
+        return items
 
     def all_inventory(self, record_type=None):
         """Return all items of the specified type (or "inventory" if not
         specified)"""
 
+        return list(self.iter_inventory(record_type))
+
+    def expirations(self, record_type=None, within_days=0, today=None):
+        """Return lists of the IDs, stored expiration dates, days left
+        from <today> (default today) and whether each expires within
+        <within_days> days, for all items of the specified type (or
+        "inventory" if not specified), all worked out in SQL"""
+
         if not record_type:
             record_type = "inventory"
 
-        record_type_id = self.record_types[record_type]
-            
-        self.cur.execute(inventory_sql, (record_type_id,))
-        
-        output = []
+        if today is None:
+            today = datetime.today()
 
-        # just too involved to do as a list comprehension because
-        # Python lambdas blow chunks
-        for row in self.cur.fetchall():
-            (id,
-             condition,
-             description,
-             amount,
-             amount_unit,
-             life,
-             life_unit,
-             record_type,
-             purchase_date) = row
-
-            amount = Measurement(amount, amount_unit)
-            life = Measurement(life, life_unit)
-            
-            output.append(InventoryItem(id, condition, description, amount, life, purchase_date))
-        
-        return output
+        day = today.strftime("%Y-%m-%d")
+
+        cur = self.conn.cursor()
+        try:
+            cur.execute(expirations_sql,
+                        (day, day, within_days,
+                         self.record_types[record_type]))
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+
+        ids = [row[0] for row in rows]
+        dates = [parse_date(row[1]) if row[1] else None for row in rows]
+        days_left = [row[2] for row in rows]
+        expiring = [bool(row[3]) if row[3] is not None else None
+                    for row in rows]
+
+        return ids, dates, days_left, expiring
+
+    def goal_coverage(self, goal):
+        """Return the total inventory held toward <goal> (as a Measurement
+        in the goal's unit) and the earliest expiration date among it"""
+
+        base_unit, factor = self.conversions[goal.amount.unit]
+
+        self.cur.execute(goal_coverage_sql,
+                         (self.conditions[goal.condition],
+                          goal.description,
+                          self.amounts[base_unit]))
+        row = self.cur.fetchone()
+
+        if row:
+            total = row[0] / factor
+            if total == int(total):
+                total = int(total)
+            return (Measurement(total, goal.amount.unit, self.conversions),
+                    parse_date(row[1]) if row[1] else None)
+        else:
+            return (Measurement(0, goal.amount.unit, self.conversions),
+                    None)
+
+    def data_version(self):
+        """Return a value that changes whenever the database file is
+        changed, whether by this InventoryDB or any other connection"""
+
+        return self.read_pool.data_version()
 
     def execute_no_commit(self, sql):
-        """Execute SQL against the current database on a connection that is
-        never committed (to avoid malicious or accidental updating or
-        deletion; return the column headers and the data"""
-        
-        conn = connect(self.filename)
-        cur = conn.cursor()
-        cur.execute(sql)
-        columns = [dsc[0]
-                   for dsc in cur.description]
-        output = cur.fetchall()
-        conn.close()
+        """Execute SQL against the current database on a pooled read-only
+        connection and return the column headers and the data.  Results
+        are cached until the data changes.  Safe to call from any
+        thread."""
+
+        output = []
+        for columns, rows in self.iter_report(sql):
+            output.extend(rows)
+
         return columns, output
 
+    def iter_report(self, sql, batch_size=500, limit=None, offset=0,
+                    cancelled=None, cache=True):
+        """Run a report's SQL on a pooled read-only connection and yield
+        (columns, rows) for each batch of up to <batch_size> rows, at
+        least once.  Skip the first <offset> rows and stop after <limit>
+        if given.  If <cancelled> is given, it is called now and then
+        while the query runs, and a true result stops it with an
+        OperationalError.  Unless <cache> is false, results of up to
+        report_cache_max_rows rows are cached until the data changes,
+        and later calls are answered from the cache whatever their
+        offset and limit; to fill it, the rows past <limit> are read
+        after the last batch is yielded, stopping as soon as there are
+        too many.  Safe to call from any thread."""
+
+        # read the version first: a commit while the report runs makes
+        # the cached result look stale, never the other way round
+        version = self.data_version()
+
+        with self._report_cache_lock:
+            cached = self._report_cache.get(sql)
+            if cached and cached[0] == version:
+                self._report_cache.move_to_end(sql)
+            else:
+                cached = None
+
+        if cached:
+            _, columns, output = cached
+            if limit is None:
+                output = output[offset:]
+            else:
+                output = output[offset:offset + limit]
+
+            for start in range(0, len(output), batch_size):
+                yield list(columns), output[start:start + batch_size]
+            if not output:
+                yield list(columns), []
+            return
+
+        # every row read, for the cache, until there are too many
+        keep = [] if cache else None
+
+        with self.read_pool.connection() as conn:
+            if cancelled:
+                conn.set_progress_handler(cancelled, 10000)
+
+            cur = conn.cursor()
+            try:
+                cur.execute(sql)
+                columns = [dsc[0]
+                           for dsc in cur.description]
+
+                # skip the rows before the offset
+                while offset > 0:
+                    skipped = cur.fetchmany(min(offset, batch_size))
+                    if not skipped:
+                        break
+                    offset -= len(skipped)
+
+                    if keep is not None:
+                        keep.extend(skipped)
+                        if len(keep) > report_cache_max_rows:
+                            keep = None
+
+                count = 0
+                yielded = False
+                while limit is None or count < limit:
+                    if limit is None:
+                        rows = cur.fetchmany(batch_size)
+                    else:
+                        rows = cur.fetchmany(min(batch_size, limit - count))
+
+                    if not rows:
+                        break
+
+                    count += len(rows)
+
+                    if keep is not None:
+                        keep.extend(rows)
+                        if len(keep) > report_cache_max_rows:
+                            keep = None
+
+                    yield columns, rows
+                    yielded = True
+
+                    if cancelled and cancelled():
+                        return
+
+                if not yielded:
+                    yield columns, []
+
+                # read the rest of a result small enough to cache, but
+                # no more than one row past the most that can be
+                with self._report_cache_lock:
+                    if self._report_too_big.get(sql) == version:
+                        keep = None
+
+                while keep is not None and limit is not None:
+                    rows = cur.fetchmany(
+                        min(batch_size,
+                            report_cache_max_rows + 1 - len(keep)))
+                    if not rows:
+                        break
+
+                    keep.extend(rows)
+                    if len(keep) > report_cache_max_rows:
+                        keep = None
+                        self._note_too_big(sql, version)
+
+                    if cancelled and cancelled():
+                        return
+            finally:
+                cur.close()
+                conn.set_progress_handler(None, 0)
+
+        if keep is not None:
+            self._cache_report(sql, version, columns, keep)
+
+    def _note_too_big(self, sql, version):
+        """Remember that the report <sql> had too many rows to cache at
+        data version <version>"""
+
+        with self._report_cache_lock:
+            self._report_too_big[sql] = version
+            self._report_too_big.move_to_end(sql)
+            while len(self._report_too_big) > report_cache_size:
+                self._report_too_big.popitem(last=False)
+
+    def _cache_report(self, sql, version, columns, output):
+        """Remember a report's results, evicting the least recently used
+        ones to stay within the cache limits"""
+
+        with self._report_cache_lock:
+            old = self._report_cache.pop(sql, None)
+            if old:
+                self._report_cache_rows -= len(old[2])
+
+            # a result too big to cache would only push everything else out
+            if len(output) > report_cache_max_rows:
+                return
+
+            self._report_cache[sql] = (version, list(columns), list(output))
+            self._report_cache_rows += len(output)
+
+            while (len(self._report_cache) > report_cache_size or
+                   self._report_cache_rows > report_cache_max_rows):
+                _, (_, _, rows) = self._report_cache.popitem(last=False)
+                self._report_cache_rows -= len(rows)
+
     def delete_item(self, item):
-        self.cur.execute(delete_sql, (item.id,))
-        self.conn.commit()
+        # the record type is read first, so take the write lock before
+        # another program can commit in between
+        with self.transaction(immediate=True):
+            record_type = self._record_type_of(item.id)
+            self.cur.execute(delete_sql, (item.id,))
+            self._publish("delete", record_type, [item.id])
+
+    def close(self):
+        """Close the database connections, first copying everything in
+        the write-ahead log back into the file"""
+
+        self._close_read_pool()
+
+        # only worth waiting for if this connection wrote anything
+        if self.profile == "performance" and self._committed:
+            self.cur.execute("pragma wal_checkpoint(truncate)")
+            self.cur.fetchall()
+
+        self.conn.close()
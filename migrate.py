@@ -0,0 +1,48 @@
+"""Bring every .qm file in a directory up to the current schema version.
+
+Usage: python migrate.py [-j JOBS] DIRECTORY
+"""
+
+import os
+import sys
+import argparse
+from glob import glob
+from concurrent.futures import ProcessPoolExecutor
+
+# the migration scripts are found relative to the application directory
+app_dir = os.path.dirname(os.path.abspath(__file__))
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Migrate all .qm files in a directory to the " +
+        "current schema version")
+    parser.add_argument("directory")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of files to migrate at once " +
+                        "(default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    paths = sorted(glob(os.path.join(os.path.abspath(args.directory),
+                                     "*.qm")))
+
+    os.chdir(app_dir)
+    from inventory import migrate_file
+
+    failed = 0
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [(path, pool.submit(migrate_file, path))
+                   for path in paths]
+
+        for path, future in futures:
+            try:
+                _, applied = future.result()
+                print("%s: %d migration(s) applied" % (path, applied))
+            except Exception as e:
+                print("%s: failed: %s" % (path, e), file=sys.stderr)
+                failed += 1
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
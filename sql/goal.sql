@@ -6,16 +6,34 @@ insert into item (
     life,
     life_unit_id,
     record_type_id,
-    purchase_date)
+    purchase_date,
+    recommendation_id)
 select condition_id,
 item,
-cast(weight * ? as integer),
+cast(weight * :multiplier as integer),
 weight_unit_id,
 life,
 life_unit_id,
-2,
-null
+(select id
+ from recordtype
+ where description = 'goal'),
+null,
+i.id
 from item i
 inner join recordtype rt
 on i.record_type_id = rt.id
-where rt.description = 'recommendation';
+where rt.description = 'recommendation'
+on conflict (recommendation_id) where recommendation_id is not null
+do update
+set condition_id = excluded.condition_id,
+item = excluded.item,
+weight = excluded.weight,
+weight_unit_id = excluded.weight_unit_id,
+life = excluded.life,
+life_unit_id = excluded.life_unit_id
+where condition_id is not excluded.condition_id or
+item is not excluded.item or
+weight is not excluded.weight or
+weight_unit_id is not excluded.weight_unit_id or
+life is not excluded.life or
+life_unit_id is not excluded.life_unit_id;
@@ -0,0 +1,12 @@
+-- Indexes for the inventory list (filtered by record type, sorted by
+-- purchase date), the expiration report and the shopping list's
+-- per-item totals.
+
+create index if not exists item_type_purchase
+on item (record_type_id, purchase_date);
+
+create index if not exists item_type_expiration
+on item (record_type_id, expiration_date);
+
+create index if not exists item_type_condition_item
+on item (record_type_id, condition_id, item);
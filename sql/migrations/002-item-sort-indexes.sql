@@ -0,0 +1,11 @@
+-- Indexes for sorting the inventory list by description, condition,
+-- amount and life.
+
+create index if not exists item_type_item
+on item (record_type_id, item);
+
+create index if not exists item_type_weight
+on item (record_type_id, weight_unit_id, weight);
+
+create index if not exists item_type_life
+on item (record_type_id, life_unit_id, life);
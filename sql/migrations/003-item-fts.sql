@@ -0,0 +1,45 @@
+-- A full-text index of item descriptions and conditions for the
+-- filter box, kept in step with the item table by triggers.
+
+create virtual table if not exists item_fts using fts5(description,
+                                                      condition);
+
+insert into item_fts (rowid, description, condition)
+select i.id,
+i.item,
+c.description
+from item i
+left outer join condition c
+on i.condition_id = c.id;
+
+create trigger if not exists item_fts_insert
+after insert on item
+begin
+    insert into item_fts (rowid, description, condition)
+    values (new.id,
+            new.item,
+            (select description
+             from condition
+             where id = new.condition_id));
+end;
+
+create trigger if not exists item_fts_update
+after update of item, condition_id on item
+begin
+    delete from item_fts
+    where rowid = old.id;
+
+    insert into item_fts (rowid, description, condition)
+    values (new.id,
+            new.item,
+            (select description
+             from condition
+             where id = new.condition_id));
+end;
+
+create trigger if not exists item_fts_delete
+after delete on item
+begin
+    delete from item_fts
+    where rowid = old.id;
+end;
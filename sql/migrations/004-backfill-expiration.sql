@@ -0,0 +1,27 @@
+-- Store an expiration date for every item with a purchase date, so
+-- the date is never worked out when the item is read.  Gives the same
+-- dates as calculate_expiration(): whole years and months fall at
+-- midnight, days keep the purchase time.  Where a life in years or
+-- months lands on a day the month doesn't have (January 31 plus a
+-- month, February 29 plus a year), the Python code fails where SQLite
+-- would roll over into the next month, so those rows are left null.
+
+update item
+set expiration_date = case (select unit
+                            from unit
+                            where id = item.life_unit_id)
+    when 'year' then case
+        when strftime('%d', purchase_date, '+' || life || ' years') =
+             strftime('%d', purchase_date)
+        then datetime(date(purchase_date, '+' || life || ' years'))
+        end
+    when 'month' then case
+        when strftime('%d', purchase_date, '+' || life || ' months') =
+             strftime('%d', purchase_date)
+        then datetime(date(purchase_date, '+' || life || ' months'))
+        end
+    when 'day' then datetime(purchase_date,
+                             '+' || life || ' days')
+    end
+where expiration_date is null and
+purchase_date is not null;
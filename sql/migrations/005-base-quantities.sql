@@ -0,0 +1,104 @@
+-- Store each item's weight and life in the base unit of its
+-- dimension (e.g. pounds and gallons as ounces and fluid ounces, months
+-- and years as days), so totals, goal comparisons and sorting work
+-- across units.
+
+-- every unit with the base unit it is defined in terms of and the
+-- number of base units it holds, following chains of ref_id
+create view if not exists unit_base (id, base_id, factor) as
+with recursive chain (id, base_id, factor) as (
+    select id,
+    id,
+    1
+    from unit
+    union all
+    select chain.id,
+    unit.ref_id,
+    chain.factor * unit.multiplier
+    from chain
+    inner join unit
+    on chain.base_id = unit.id
+    where unit.ref_id is not null)
+select id,
+base_id,
+factor
+from chain
+where base_id not in (select id
+                      from unit
+                      where ref_id is not null);
+
+alter table item add column base_weight real;
+alter table item add column base_weight_unit_id integer
+    references unit(id);
+alter table item add column base_life real;
+alter table item add column base_life_unit_id integer
+    references unit(id);
+
+update item
+set base_weight = weight * (select factor
+                            from unit_base
+                            where id = item.weight_unit_id),
+base_weight_unit_id = (select base_id
+                       from unit_base
+                       where id = item.weight_unit_id),
+base_life = life * (select factor
+                    from unit_base
+                    where id = item.life_unit_id),
+base_life_unit_id = (select base_id
+                     from unit_base
+                     where id = item.life_unit_id);
+
+create trigger if not exists item_base_insert
+after insert on item
+begin
+    update item
+    set base_weight = new.weight * (select factor
+                                    from unit_base
+                                    where id = new.weight_unit_id),
+    base_weight_unit_id = (select base_id
+                           from unit_base
+                           where id = new.weight_unit_id),
+    base_life = new.life * (select factor
+                            from unit_base
+                            where id = new.life_unit_id),
+    base_life_unit_id = (select base_id
+                         from unit_base
+                         where id = new.life_unit_id)
+    where id = new.id;
+end;
+
+create trigger if not exists item_base_update
+after update of weight, weight_unit_id, life, life_unit_id on item
+begin
+    update item
+    set base_weight = new.weight * (select factor
+                                    from unit_base
+                                    where id = new.weight_unit_id),
+    base_weight_unit_id = (select base_id
+                           from unit_base
+                           where id = new.weight_unit_id),
+    base_life = new.life * (select factor
+                            from unit_base
+                            where id = new.life_unit_id),
+    base_life_unit_id = (select base_id
+                         from unit_base
+                         where id = new.life_unit_id)
+    where id = new.id;
+end;
+
+-- sort by quantity in base units instead of by unit and number
+drop index if exists item_type_weight;
+drop index if exists item_type_life;
+
+create index if not exists item_type_base_weight
+on item (record_type_id, base_weight_unit_id, base_weight);
+
+create index if not exists item_type_base_life
+on item (record_type_id, base_life_unit_id, base_life);
+
+-- shopping list totals per item in base units; this also serves
+-- everything item_type_condition_item did
+drop index if exists item_type_condition_item;
+
+create index if not exists item_type_condition_item_base
+on item (record_type_id, condition_id, item, base_weight_unit_id);
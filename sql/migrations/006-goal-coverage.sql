@@ -0,0 +1,175 @@
+-- A running summary of inventory per item (by condition, description
+-- and base unit) holding the total amount and earliest expiration, so
+-- goals can be checked without adding up the whole inventory.  Each
+-- trigger takes out the old row's share and adds the new row's, so
+-- the summary stays right whatever order triggers fire in.
+
+create table if not exists goal_coverage (
+    condition_id integer not null,
+    item text not null,
+    base_weight_unit_id integer not null,
+    total_base_weight real not null,
+    item_count integer not null,
+    first_expiration_date datetime null,
+    primary key (condition_id, item, base_weight_unit_id),
+    foreign key (condition_id) references condition(id),
+    foreign key (base_weight_unit_id) references unit(id)
+);
+
+insert into goal_coverage (condition_id,
+                           item,
+                           base_weight_unit_id,
+                           total_base_weight,
+                           item_count,
+                           first_expiration_date)
+select condition_id,
+item,
+base_weight_unit_id,
+sum(base_weight),
+count(*),
+min(expiration_date)
+from item
+where record_type_id = (select id
+                        from recordtype
+                        where description = 'inventory') and
+base_weight_unit_id is not null
+group by condition_id,
+item,
+base_weight_unit_id;
+
+-- finding the earliest expiration again when the earliest item goes
+drop index if exists item_type_condition_item_base;
+
+create index if not exists item_type_coverage
+on item (record_type_id, condition_id, item, base_weight_unit_id,
+         expiration_date);
+
+create trigger if not exists goal_coverage_insert
+after insert on item
+when new.record_type_id = (select id
+                           from recordtype
+                           where description = 'inventory') and
+new.base_weight_unit_id is not null
+begin
+    insert into goal_coverage (condition_id,
+                               item,
+                               base_weight_unit_id,
+                               total_base_weight,
+                               item_count,
+                               first_expiration_date)
+    values (new.condition_id,
+            new.item,
+            new.base_weight_unit_id,
+            new.base_weight,
+            1,
+            new.expiration_date)
+    on conflict (condition_id, item, base_weight_unit_id) do update
+    set total_base_weight = total_base_weight +
+                            excluded.total_base_weight,
+    item_count = item_count + 1,
+    first_expiration_date = case
+        when excluded.first_expiration_date is null
+            then first_expiration_date
+        when first_expiration_date is null or
+             excluded.first_expiration_date < first_expiration_date
+            then excluded.first_expiration_date
+        else first_expiration_date
+        end;
+end;
+
+create trigger if not exists goal_coverage_update_new
+after update on item
+when new.record_type_id = (select id
+                           from recordtype
+                           where description = 'inventory') and
+new.base_weight_unit_id is not null
+begin
+    insert into goal_coverage (condition_id,
+                               item,
+                               base_weight_unit_id,
+                               total_base_weight,
+                               item_count,
+                               first_expiration_date)
+    values (new.condition_id,
+            new.item,
+            new.base_weight_unit_id,
+            new.base_weight,
+            1,
+            new.expiration_date)
+    on conflict (condition_id, item, base_weight_unit_id) do update
+    set total_base_weight = total_base_weight +
+                            excluded.total_base_weight,
+    item_count = item_count + 1,
+    first_expiration_date = case
+        when excluded.first_expiration_date is null
+            then first_expiration_date
+        when first_expiration_date is null or
+             excluded.first_expiration_date < first_expiration_date
+            then excluded.first_expiration_date
+        else first_expiration_date
+        end;
+end;
+
+create trigger if not exists goal_coverage_update_old
+after update on item
+when old.record_type_id = (select id
+                           from recordtype
+                           where description = 'inventory') and
+old.base_weight_unit_id is not null
+begin
+    update goal_coverage
+    set total_base_weight = total_base_weight - old.base_weight,
+    item_count = item_count - 1,
+    first_expiration_date = case
+        when old.expiration_date is null or
+             old.expiration_date > first_expiration_date
+            then first_expiration_date
+        else (select min(expiration_date)
+              from item
+              where record_type_id = old.record_type_id and
+              condition_id = old.condition_id and
+              item = old.item and
+              base_weight_unit_id = old.base_weight_unit_id)
+        end
+    where condition_id = old.condition_id and
+    item = old.item and
+    base_weight_unit_id = old.base_weight_unit_id;
+
+    delete from goal_coverage
+    where condition_id = old.condition_id and
+    item = old.item and
+    base_weight_unit_id = old.base_weight_unit_id and
+    item_count <= 0;
+end;
+
+create trigger if not exists goal_coverage_delete
+after delete on item
+when old.record_type_id = (select id
+                           from recordtype
+                           where description = 'inventory') and
+old.base_weight_unit_id is not null
+begin
+    update goal_coverage
+    set total_base_weight = total_base_weight - old.base_weight,
+    item_count = item_count - 1,
+    first_expiration_date = case
+        when old.expiration_date is null or
+             old.expiration_date > first_expiration_date
+            then first_expiration_date
+        else (select min(expiration_date)
+              from item
+              where record_type_id = old.record_type_id and
+              condition_id = old.condition_id and
+              item = old.item and
+              base_weight_unit_id = old.base_weight_unit_id)
+        end
+    where condition_id = old.condition_id and
+    item = old.item and
+    base_weight_unit_id = old.base_weight_unit_id;
+
+    delete from goal_coverage
+    where condition_id = old.condition_id and
+    item = old.item and
+    base_weight_unit_id = old.base_weight_unit_id and
+    item_count <= 0;
+end;
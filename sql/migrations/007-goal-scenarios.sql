@@ -0,0 +1,39 @@
+-- Keep goal plans as named scenarios.  Each goal computed from a
+-- recommendation remembers which one, so a new plan can update the
+-- goals in place instead of deleting and inserting them all.
+
+alter table item add column recommendation_id integer
+references item(id);
+
+-- link the goals already computed to their recommendations; where
+-- several goals match one, the oldest keeps the link
+update item
+set recommendation_id = (select r.id
+                         from item r
+                         where r.record_type_id = (select id
+                                                   from recordtype
+                                                   where description =
+                                                   'recommendation') and
+                         r.condition_id = item.condition_id and
+                         r.item = item.item
+                         order by r.id
+                         limit 1)
+where record_type_id = (select id
+                        from recordtype
+                        where description = 'goal') and
+id = (select min(g.id)
+      from item g
+      where g.record_type_id = item.record_type_id and
+      g.condition_id = item.condition_id and
+      g.item = item.item);
+
+create unique index if not exists item_goal_recommendation
+on item (recommendation_id)
+where recommendation_id is not null;
+
+create table if not exists goal_scenario (
+    id integer not null primary key,
+    name text not null unique,
+    multiplier real not null,
+    active integer not null default 0
+);
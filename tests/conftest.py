@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# the modules and SQL scripts are found relative to the application
+# directory
+app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_dir)
+
+@pytest.fixture(autouse=True)
+def in_app_dir(monkeypatch):
+    monkeypatch.chdir(app_dir)
+
+@pytest.fixture
+def db(tmp_path):
+    """A new, empty InventoryDB in a temporary directory"""
+    from inventory import InventoryDB
+
+    db = InventoryDB(str(tmp_path / "test.qm"))
+    yield db
+    db.close()
@@ -0,0 +1,89 @@
+"""Check that expiration dates worked out in SQL and in batches agree
+with the ones InventoryItem works out one at a time"""
+
+from datetime import datetime
+
+from inventory import (calculate_expiration, format_date, migrations,
+                       parse_date)
+
+# purchase dates at month ends, on leap days and partway through a day
+purchase_dates = [datetime(2024, 1, 31),
+                  datetime(2024, 2, 29),
+                  datetime(2023, 12, 31),
+                  datetime(2024, 3, 31, 14, 30),
+                  datetime(2024, 8, 15, 9, 0),
+                  datetime(2024, 11, 30)]
+
+lives = [(n, unit)
+         for unit in ["year", "month", "day"]
+         for n in [1, 2, 4, 11, 12, 13, 30, 365]]
+
+def scalar_expiration(purchase_date, number, unit):
+    """What InventoryItem.expiration_date works out, or None where it
+    fails"""
+    try:
+        return calculate_expiration(purchase_date, number, unit)
+    except ValueError: # a month without the purchase day
+        return None
+
+def migration(number):
+    return dict(migrations())[number]
+
+def test_backfill_matches_calculation(db):
+    cases = [(purchase_date, number, unit)
+             for purchase_date in purchase_dates
+             for number, unit in lives]
+
+    ids = []
+    for purchase_date, number, unit in cases:
+        db.cur.execute("insert into item (condition_id, item, weight, " +
+                       "weight_unit_id, life, life_unit_id, " +
+                       "record_type_id, purchase_date) " +
+                       "values (1, 'Beans', 1, ?, ?, ?, ?, ?)",
+                       (db.amounts["pound"], number, db.durations[unit],
+                        db.record_types["inventory"],
+                        format_date(purchase_date)))
+        ids.append(db.cur.lastrowid)
+    db.conn.commit()
+
+    db.conn.executescript(migration(4))
+
+    for id, (purchase_date, number, unit) in zip(ids, cases):
+        db.cur.execute("select expiration_date from item where id = ?",
+                       (id,))
+        stored = db.cur.fetchone()[0]
+        expected = scalar_expiration(purchase_date, number, unit)
+        assert (parse_date(stored) if stored else None) == expected, (
+            purchase_date, number, unit)
+
+def test_batch_matches_scalar():
+    from inventory import InventoryItem, Measurement, expiration_dates
+
+    today = datetime(2024, 6, 1, 15, 0)
+    items = [InventoryItem(None, "", "Beans", Measurement(1, "pound"),
+                           Measurement(number, unit), purchase_date)
+             for purchase_date in purchase_dates + [None]
+             for number, unit in lives]
+
+    # the same pairs again, as when items are bought together
+    items += items[:20]
+
+    dates, days_left, expiring = expiration_dates(
+        [item.purchase_date for item in items],
+        [item.life for item in items],
+        within_days=30,
+        today=today)
+
+    assert None in dates
+    for item, date, days, soon in zip(items, dates, days_left, expiring):
+        try:
+            expected = item.expiration_date
+        except ValueError: # a month without the purchase day
+            expected = None
+
+        assert date == expected
+        if expected is None:
+            assert days is None and soon is None
+        else:
+            assert days == (expected.date() - today.date()).days
+            assert soon == (days <= 30)
@@ -0,0 +1,67 @@
+"""Check that exported reports read back as they were written, in each
+format"""
+
+import csv
+import io
+import json
+
+import pytest
+
+from export import (main, read_columnar, write_columnar, write_csv,
+                    write_jsonl)
+
+columns = ["id", "name", "weight", "data", "mixed", "empty"]
+
+rows = [(1, "Beans", 1.5, b"\x00\xff", 1, None),
+        (2, "Rice é", None, None, "two", None),
+        (None, "", 3.0, b"", 2**70, None),
+        (-2**63, "Honey", 4, b"abc", 2.5, None)]
+
+def test_columnar_round_trip():
+    f = io.BytesIO()
+    batches = [(columns, rows[:3]), (columns, []), (columns, rows[3:])]
+    assert write_columnar(batches, f) == len(rows)
+
+    f.seek(0)
+    groups = list(read_columnar(f))
+    assert [len(group_rows) for _, group_rows in groups] == [3, 1]
+    assert all(group_columns == columns for group_columns, _ in groups)
+
+    read = [row for _, group_rows in groups for row in group_rows]
+    assert read == rows
+
+def test_columnar_empty_result():
+    f = io.BytesIO()
+    assert write_columnar([(columns, [])], f) == 0
+
+    f.seek(0)
+    assert list(read_columnar(f)) == []
+
+def test_columnar_cut_short():
+    f = io.BytesIO()
+    write_columnar([(columns, rows)], f)
+
+    with pytest.raises(ValueError):
+        list(read_columnar(io.BytesIO(f.getvalue()[:-8])))
+
+def test_blobs_in_base64():
+    csv_file = io.StringIO(newline="")
+    write_csv([(columns, rows)], csv_file)
+    jsonl_file = io.StringIO()
+    write_jsonl([(columns, rows)], jsonl_file)
+
+    csv_rows = list(csv.reader(io.StringIO(csv_file.getvalue())))
+    json_rows = [json.loads(line)
+                 for line in jsonl_file.getvalue().splitlines()]
+
+    assert csv_rows[0] == columns
+    assert [row[3] for row in csv_rows[1:]] == ["AP8=", "", "", "YWJj"]
+    assert [row["data"] for row in json_rows] == ["AP8=", None, "", "YWJj"]
+
+def test_unknown_output_format(tmp_path, capsys):
+    with pytest.raises(SystemExit) as e:
+        main(["-o", str(tmp_path / "x.txt"), "--sql",
+              str(tmp_path / "test.qm"), "select 1"])
+
+    assert e.value.code == 2
+    assert "expected a .csv, .jsonl or .qmc file" in capsys.readouterr().err
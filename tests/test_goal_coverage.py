@@ -0,0 +1,110 @@
+"""Check that the goal_coverage summary kept by triggers matches the
+inventory it summarizes through any mix of writes"""
+
+import random
+from datetime import datetime
+
+from inventory import InventoryItem, Measurement
+
+coverage_sql = """
+select condition_id,
+item,
+base_weight_unit_id,
+round(total_base_weight, 6),
+item_count,
+first_expiration_date
+from goal_coverage
+order by 1, 2, 3"""
+
+# the summary worked out afresh from the amounts as entered
+expected_sql = """
+select i.condition_id,
+i.item,
+ub.base_id,
+round(sum(i.weight * ub.factor), 6),
+count(*),
+min(i.expiration_date)
+from item i
+inner join unit_base ub
+on i.weight_unit_id = ub.id
+where i.record_type_id = ?
+group by i.condition_id,
+i.item,
+ub.base_id
+order by 1, 2, 3"""
+
+def check(db):
+    assert (db.conn.execute(coverage_sql).fetchall() ==
+            db.conn.execute(expected_sql,
+                            (db.record_types["inventory"],)).fetchall())
+
+def test_random_writes(db):
+    rng = random.Random(14)
+
+    def new_item():
+        date = rng.choice([None,
+                           datetime(2020, rng.randint(1, 12),
+                                    rng.randint(1, 28))])
+        return InventoryItem(None,
+                             rng.choice(["Canned", "Dry", ""]),
+                             rng.choice(["Beans", "Rice", "Honey"]),
+                             Measurement(rng.randint(1, 9),
+                                         rng.choice(["pound", "ounce",
+                                                     "gallon", "each"])),
+                             Measurement(rng.randint(1, 3),
+                                         rng.choice(["year", "month"])),
+                             date)
+
+    for step in range(600):
+        action = rng.random()
+        items = db.all_inventory()
+        if action < 0.3 or not items:
+            item = new_item()
+            db.add_inventory(item, rng.choice(["inventory", "inventory",
+                                               "goal"]))
+        elif action < 0.4:
+            db.add_inventory_many([new_item() for i in range(5)])
+        elif action < 0.7:
+            item = rng.choice(items)
+            changed = new_item()
+            item.condition = changed.condition
+            item.description = changed.description
+            item.amount = changed.amount
+            item.life = changed.life
+            item.purchase_date = changed.purchase_date
+            db.save_inventory(item)
+        elif action < 0.75:
+            # copied whole, base quantities and all
+            with db.transaction():
+                db.cur.execute("insert into item (condition_id, item, " +
+                               "weight, weight_unit_id, life, " +
+                               "life_unit_id, record_type_id, " +
+                               "purchase_date, expiration_date, " +
+                               "base_weight, base_weight_unit_id, " +
+                               "base_life, base_life_unit_id) " +
+                               "select condition_id, item, weight, " +
+                               "weight_unit_id, life, life_unit_id, " +
+                               "record_type_id, purchase_date, " +
+                               "expiration_date, base_weight, " +
+                               "base_weight_unit_id, base_life, " +
+                               "base_life_unit_id " +
+                               "from item " +
+                               "where id = ?",
+                               (rng.choice(items).id,))
+        elif action < 0.85:
+            # moved in or out of the inventory
+            with db.transaction():
+                db.cur.execute("update item set record_type_id = ? " +
+                               "where id = (select id " +
+                               "            from item " +
+                               "            where record_type_id in (?, ?) " +
+                               "            order by random() " +
+                               "            limit 1)",
+                               (rng.choice([db.record_types["inventory"],
+                                            db.record_types["goal"]]),
+                                db.record_types["inventory"],
+                                db.record_types["goal"]))
+        else:
+            db.delete_item(rng.choice(items))
+
+        check(db)
@@ -0,0 +1,185 @@
+"""Check that goal plans update the goals in place: only what changes is
+written, goals added by hand are kept, and files whose goals were made
+before goals remembered their recommendations migrate cleanly"""
+
+from sqlite3 import connect
+
+import pytest
+
+from inventory import InventoryDB, InventoryItem, Measurement
+from test_migrate import old_file
+
+def listen(db):
+    """Return a list that collects (action, record type, IDs) for each
+    change <db> publishes"""
+    events = []
+    db.add_listener(lambda event: events.append(
+        (event.action, event.record_type, sorted(event.ids))))
+    return events
+
+def goals(db):
+    """Return (id, recommendation ID, condition, description, weight) for
+    each goal"""
+    return db.conn.execute("select id, recommendation_id, condition_id, " +
+                           "item, weight " +
+                           "from item " +
+                           "where record_type_id = ? " +
+                           "order by id",
+                           (db.record_types["goal"],)).fetchall()
+
+def recommendation_count(db):
+    return len(db.all_inventory("recommendation"))
+
+def hand_goal():
+    return InventoryItem(None, "Canned", "Peaches",
+                         Measurement(12, "pound"),
+                         Measurement(2, "year"),
+                         None)
+
+def test_plan_makes_one_goal_per_recommendation(db):
+    events = listen(db)
+    db.set_goals(2)
+
+    rows = goals(db)
+    assert len(rows) == recommendation_count(db)
+    assert len(set(row[1] for row in rows)) == len(rows)
+    assert events == [("insert", "goal", [row[0] for row in rows])]
+
+def test_same_plan_writes_nothing(db):
+    db.set_goals(2)
+
+    before = db.conn.total_changes
+    events = listen(db)
+    db.set_goals(2)
+
+    assert db.conn.total_changes == before
+    assert events == []
+
+def test_new_multiplier_updates_in_place(db):
+    db.set_goals(1)
+    before = goals(db)
+
+    events = listen(db)
+    db.set_goals(3)
+    after = goals(db)
+
+    assert [row[:4] for row in after] == [row[:4] for row in before]
+    changed = [new[0] for old, new in zip(before, after) if old != new]
+    assert changed
+    assert events == [("update", "goal", changed)]
+
+def test_hand_added_goal_survives(db):
+    db.set_goals(1)
+    item = hand_goal()
+    db.add_inventory(item, "goal")
+
+    db.set_goals(4)
+
+    [kept] = [row for row in goals(db) if row[0] == item.id]
+    assert kept[1] is None
+    assert kept[4] == 12
+
+def test_deleted_recommendation_removes_goal(db):
+    db.set_goals(2)
+    recommendation = db.all_inventory("recommendation")[0]
+    [goal_id] = [row[0] for row in goals(db)
+                 if row[1] == recommendation.id]
+
+    db.delete_item(recommendation)
+    events = listen(db)
+    db.set_goals(2)
+
+    assert goal_id not in [row[0] for row in goals(db)]
+    assert len(goals(db)) == recommendation_count(db)
+    assert events == [("delete", "goal", [goal_id])]
+
+def test_use_scenario(db):
+    db.set_goals(1, "single")
+    single = goals(db)
+    db.set_goals(4, "family")
+    assert db.active_scenario() == "family"
+
+    events = listen(db)
+    db.use_scenario("single")
+
+    assert db.active_scenario() == "single"
+    assert goals(db) == single
+    assert [event[:2] for event in events] == [("update", "goal")]
+    assert [name for name, _, active in db.scenarios()
+            if active] == ["single"]
+
+    with pytest.raises(KeyError):
+        db.use_scenario("nobody")
+    assert db.active_scenario() == "single"
+
+# goals as set_goals() made them before they remembered their
+# recommendations
+old_goal_sql = """
+insert into item (
+    condition_id,
+    item,
+    weight,
+    weight_unit_id,
+    life,
+    life_unit_id,
+    record_type_id,
+    purchase_date)
+select condition_id,
+item,
+cast(weight * ? as integer),
+weight_unit_id,
+life,
+life_unit_id,
+2,
+null
+from item i
+inner join recordtype rt
+on i.record_type_id = rt.id
+where rt.description = 'recommendation'"""
+
+def test_old_goals_migrate_without_duplicates(tmp_path):
+    path = str(tmp_path / "old.qm")
+    old_file(path)
+
+    conn = connect(path)
+    conn.execute(old_goal_sql, (2,))
+
+    # a goal added by hand with the same name as a computed one, and
+    # one of its own
+    conn.execute("insert into item (condition_id, item, weight, " +
+                 "weight_unit_id, life, life_unit_id, record_type_id) " +
+                 "select condition_id, item, 1, weight_unit_id, life, " +
+                 "life_unit_id, record_type_id " +
+                 "from item " +
+                 "where record_type_id = 2 " +
+                 "order by id " +
+                 "limit 1")
+    conn.execute("insert into item (condition_id, item, weight, " +
+                 "weight_unit_id, life, life_unit_id, record_type_id) " +
+                 "select condition_id, 'Peaches', 1, weight_unit_id, " +
+                 "life, life_unit_id, record_type_id " +
+                 "from item " +
+                 "where record_type_id = 2 " +
+                 "order by id " +
+                 "limit 1")
+    conn.commit()
+    count = conn.execute("select count(*) from item " +
+                         "where record_type_id = 2").fetchone()[0]
+    conn.close()
+
+    db = InventoryDB(path)
+    try:
+        # the computed goals were linked, so the same plan changes
+        # nothing and another only updates them
+        events = listen(db)
+        db.set_goals(2)
+        assert events == []
+        assert len(goals(db)) == count
+
+        db.set_goals(3)
+        rows = goals(db)
+        assert len(rows) == count
+        linked = [row[1] for row in rows if row[1] is not None]
+        assert len(linked) == len(set(linked)) == recommendation_count(db)
+    finally:
+        db.close()
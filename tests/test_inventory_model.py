@@ -0,0 +1,165 @@
+"""Check that the inventory table's model stays in step with a fresh
+query as the file is changed, here and by other programs"""
+
+import os
+import random
+from datetime import datetime
+from sqlite3 import connect
+
+import pytest
+
+# no display is needed to drive a model
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+pytest.importorskip("PyQt5.QtWidgets")
+
+from PyQt5.QtCore import QCoreApplication, QThreadPool, Qt
+
+from app import InventoryListModel
+from inventory import Measurement
+from test_paging import make_items
+
+def settle():
+    """Let running filters finish and deliver their rows"""
+    QThreadPool.globalInstance().waitForDone()
+    QCoreApplication.processEvents()
+
+def model_ids(model):
+    return [item.id for item in model.items]
+
+def query_ids(db, filter="", sort=None, descending=False):
+    return [item.id
+            for item in db.search(filter, "inventory", sort, descending)]
+
+@pytest.fixture
+def model(db):
+    model = InventoryListModel(None, db, "inventory", page_size=7)
+    yield model
+    model.close()
+    settle()
+
+def test_filtered_sees_external_changes(db, model):
+    db.add_inventory_many(make_items(50))
+    db.poll_changes()
+
+    model.set_filter("beans")
+    settle()
+    assert len(model_ids(model)) == 50
+
+    other = connect(db.filename)
+    try:
+        other.execute("delete from item where record_type_id = ?",
+                      (db.record_types["inventory"],))
+        other.commit()
+    finally:
+        other.close()
+
+    assert db.poll_changes()
+    settle()
+    assert model_ids(model) == []
+
+def check(db, model):
+    """Assert that the model holds the first rows of a fresh query, or
+    all of them once everything has been read"""
+    expected = query_ids(db, model.filter, model.sort_attrib,
+                         model.descending)
+    got = model_ids(model)
+
+    if model.filter.strip() != "" and model.sort_attrib is None:
+        # ranked by the database; only the set of rows is certain
+        assert sorted(got) == sorted(expected)
+    elif model._exhausted:
+        assert got == expected
+    else:
+        assert got == expected[:len(got)]
+
+sorts = [None, "id", "condition", "description", "amount", "life",
+         "purchase_date", "expiration_date"]
+
+@pytest.mark.parametrize("sort", sorts)
+@pytest.mark.parametrize("descending", [False, True])
+def test_random_changes(db, model, sort, descending):
+    rng = random.Random("%s %s" % (sort, descending))
+    db.add_inventory_many(make_items(60))
+
+    if sort is not None:
+        model.sort(model.item_attribs.index(sort),
+                   Qt.DescendingOrder if descending else Qt.AscendingOrder)
+
+    def new_item():
+        item = make_items(1, rng.choice(["Canned", "Dry", ""]))[0]
+        item.description = rng.choice(["Beans %d" % rng.randrange(9),
+                                       "beans red", "Rice"])
+        item.amount = Measurement(rng.randint(1, 9),
+                                  rng.choice(["pound", "ounce"]))
+        item.purchase_date = rng.choice(
+            [None, datetime(2020, rng.randint(1, 12), rng.randint(1, 28))])
+        return item
+
+    for step in range(75):
+        if step % 25 == 0:
+            model.set_filter(rng.choice(["", "", "beans", "beans 3", "dry"]))
+            settle()
+
+        action = rng.random()
+        items = db.all_inventory()
+        if action < 0.25:
+            if model.canFetchMore(None):
+                model.fetchMore(None)
+        elif action < 0.45:
+            db.add_inventory(new_item())
+        elif action < 0.75 and items:
+            # often the last row read, where the next page starts
+            if model.items and rng.random() < 0.5:
+                id = model.items[-1].id
+                item = [item for item in items if item.id == id][0]
+            else:
+                item = rng.choice(items)
+            changed = new_item()
+            item.condition = changed.condition
+            item.description = changed.description
+            item.amount = changed.amount
+            item.purchase_date = changed.purchase_date
+            db.save_inventory(item)
+        elif action < 0.95 and items:
+            db.delete_item(rng.choice(items))
+        else:
+            db.add_inventory_many([new_item() for i in range(10)])
+        settle()
+
+        check(db, model)
+
+    while model.canFetchMore(None):
+        model.fetchMore(None)
+    check(db, model)
+
+def test_edit_last_loaded_row(db, model):
+    db.add_inventory_many(make_items(60))
+    model.sort(model.item_attribs.index("condition"), Qt.AscendingOrder)
+
+    # move the last row read past rows not read yet
+    item = db.get_items([model.items[-1].id])[0]
+    item.condition = "Dry"
+    item.description = "beans red"
+    db.save_inventory(item)
+
+    while model.canFetchMore(None):
+        model.fetchMore(None)
+    assert model_ids(model) == query_ids(db, "", "condition")
+
+def test_bulk_changes_while_filtered(db, model):
+    db.add_inventory_many(make_items(50))
+    model.set_filter("beans")
+    settle()
+    assert len(model_ids(model)) == 50
+
+    # more rows than a page are read again rather than placed one by one
+    db.add_inventory_many(make_items(300))
+    settle()
+    assert sorted(model_ids(model)) == sorted(query_ids(db, "beans"))
+    assert len(model_ids(model)) == 350
+
+    with db.transaction():
+        for item in db.all_inventory()[:200]:
+            db.delete_item(item)
+    settle()
+    assert sorted(model_ids(model)) == sorted(query_ids(db, "beans"))
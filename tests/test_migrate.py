@@ -0,0 +1,49 @@
+"""Check that schema migrations apply once, even when two connections
+migrate the same file at the same time"""
+
+import codecs
+from concurrent.futures import ThreadPoolExecutor
+from sqlite3 import connect
+
+from inventory import migrate_file, schema_version, split_script
+
+def old_file(path):
+    """Make a file as new ones were made before any migration existed"""
+    with codecs.open("sql/create-db.sql", "r", "utf-8") as f:
+        sql = f.read()
+
+    conn = connect(path)
+    conn.executescript(sql)
+    conn.close()
+
+def test_split_script():
+    sql = """create table t (a text);
+insert into t values ('a;b');
+create trigger tt after insert on t
+begin
+    delete from t where a = ';';
+end;
+"""
+    assert [statement.split()[0:2]
+            for statement in split_script(sql)] == [["create", "table"],
+                                                    ["insert", "into"],
+                                                    ["create", "trigger"]]
+
+def test_concurrent_migration(tmp_path):
+    for trial in range(5):
+        path = str(tmp_path / ("old-%d.qm" % trial))
+        old_file(path)
+
+        with ThreadPoolExecutor(2) as pool:
+            results = list(pool.map(migrate_file, [path, path]))
+
+        assert sum(applied for _, applied in results) == schema_version()
+
+        conn = connect(path)
+        try:
+            assert (conn.execute("pragma user_version").fetchone()[0] ==
+                    schema_version())
+            assert (conn.execute("select count(*) from item_fts").fetchone() ==
+                    conn.execute("select count(*) from item").fetchone())
+        finally:
+            conn.close()
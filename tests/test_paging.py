@@ -0,0 +1,118 @@
+"""Check that the inventory table's pages come out in the same order as
+a single query, keep up with writes between pages, and leave the file
+free for other programs"""
+
+from datetime import datetime
+from sqlite3 import connect
+
+import pytest
+
+from inventory import InventoryItem, Measurement, inventory_sort_columns
+
+def make_items(n, condition="Canned"):
+    # plenty of ties, and some items with no dates
+    return [InventoryItem(None,
+                          [condition, "Dry", ""][i % 3],
+                          "Beans %d" % (i % 7),
+                          Measurement(i % 5 + 1, ["pound", "ounce"][i % 2]),
+                          Measurement(i % 3 + 1, ["year", "month"][i % 2]),
+                          datetime(2020, 1, i % 4 + 1) if i % 6 else None)
+            for i in range(n)]
+
+def read_pages(db, sort, descending, page_size, items=None):
+    """Read the pages of a query as the inventory table does, starting
+    after <items> if given"""
+    items = list(items or [])
+    while True:
+        page = db.inventory_page("inventory", sort, descending,
+                                 items[-1].id if items else None,
+                                 page_size)
+        items.extend(page)
+        if len(page) < page_size:
+            return items
+
+def ids(items):
+    return [item.id for item in items]
+
+sorts = [None] + sorted(inventory_sort_columns)
+
+@pytest.mark.parametrize("sort", sorts)
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_match_query(db, sort, descending):
+    db.add_inventory_many(make_items(200))
+
+    expected = list(db.iter_inventory("inventory", None, sort, descending))
+    assert len(expected) == 200
+
+    for page_size in [1, 7, 50]:
+        assert (ids(read_pages(db, sort, descending, page_size)) ==
+                ids(expected))
+
+@pytest.mark.parametrize("sort", sorts)
+def test_pages_by_name_match_query(db, sort):
+    # the sorts used when lookup tables aren't numbered alphabetically
+    db.sort_columns = dict(inventory_sort_columns)
+    db.add_inventory_many(make_items(100))
+
+    expected = list(db.iter_inventory("inventory", None, sort))
+    assert ids(read_pages(db, sort, False, 9)) == ids(expected)
+
+def test_pages_see_writes(db):
+    db.add_inventory_many(make_items(300))
+
+    for sort in ["condition", "id", None]:
+        first_page = db.inventory_page("inventory", sort, False, None, 100)
+
+        # sorts after everything read so far
+        item = make_items(1, "Frozen")[0]
+        item.purchase_date = datetime(2000, 1, 1)
+        db.add_inventory(item)
+
+        items = read_pages(db, sort, False, 100, first_page)
+        expected = db.iter_inventory("inventory", None, sort)
+        assert ids(items) == ids(expected)
+
+def test_page_after_deleted_item(db):
+    db.add_inventory_many(make_items(10))
+    page = db.inventory_page("inventory", None, False, None, 5)
+    db.delete_item(page[-1])
+
+    with pytest.raises(KeyError):
+        db.inventory_page("inventory", None, False, page[-1].id, 5)
+
+def test_page_leaves_file_writable(db):
+    db.add_inventory_many(make_items(300))
+    db.inventory_page("inventory", None, False, None, 100)
+
+    # another program fails at once if the file is locked
+    other = connect(db.filename, timeout=0)
+    try:
+        other.execute("insert into item " +
+                      "(condition_id, item, weight, weight_unit_id, " +
+                      "life, life_unit_id, record_type_id) " +
+                      "select condition_id, item, weight, weight_unit_id, " +
+                      "life, life_unit_id, record_type_id " +
+                      "from item " +
+                      "limit 1")
+        other.commit()
+    finally:
+        other.close()
+
+def external_delete(filename):
+    other = connect(filename)
+    try:
+        other.execute("delete from item where id = (select max(id) from item)")
+        other.commit()
+    finally:
+        other.close()
+
+def test_partly_loaded_sees_external_changes(db):
+    db.add_inventory_many(make_items(300))
+    db.poll_changes()
+
+    # the table has shown its first page and is waiting to be scrolled
+    db.inventory_page("inventory", None, False, None, 100)
+
+    external_delete(db.filename)
+    assert db.poll_changes()
+    assert not db.poll_changes()
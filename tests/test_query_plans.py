@@ -0,0 +1,65 @@
+"""Check that the built-in queries and reports find their rows through
+an index rather than reading the whole item table"""
+
+import os
+import re
+from glob import glob
+
+import pytest
+
+from inventory import (Report, goal_changes_sql, goal_orphans_sql,
+                       inventory_sort_columns)
+
+reports_dir = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "reports")
+
+# tables small enough that reading them whole is fine
+lookup_tables = {"recordtype", "condition", "unit", "unit_base"}
+
+def full_scans(db, sql, params=()):
+    """Return the lines of <sql>'s query plan that read a table whole"""
+
+    scans = []
+    for row in db.conn.execute("explain query plan " + sql, params):
+        detail = row[3]
+        match = re.match(r"SCAN (\w+)", detail)
+        if (match and
+            "VIRTUAL TABLE" not in detail and
+            match.group(1) not in lookup_tables):
+            scans.append(detail)
+    return scans
+
+sorts = [None] + sorted(inventory_sort_columns)
+
+@pytest.mark.parametrize("sort", sorts)
+@pytest.mark.parametrize("descending", [False, True])
+def test_inventory_query(db, sort, descending):
+    sql, params = db.inventory_query("inventory", None, sort, descending)
+    assert full_scans(db, sql, params) == []
+
+@pytest.mark.parametrize("sort", sorts)
+def test_inventory_query_by_name(db, sort):
+    # the sorts used when lookup tables aren't numbered alphabetically
+    db.sort_columns = dict(inventory_sort_columns)
+    sql, params = db.inventory_query("inventory", None, sort)
+    assert full_scans(db, sql, params) == []
+
+def test_inventory_query_filtered(db):
+    sql, params = db.inventory_query("inventory", "canned beans")
+    assert full_scans(db, sql, params) == []
+
+@pytest.mark.parametrize("sort", sorts)
+def test_search(db, sort):
+    sql, params = db.search_query("beans", "inventory", sort)
+    assert full_scans(db, sql, params) == []
+
+@pytest.mark.parametrize("sql", [goal_changes_sql, goal_orphans_sql])
+def test_goal_queries(db, sql):
+    params = {"goal": db.record_types["goal"],
+              "recommendation": db.record_types["recommendation"],
+              "multiplier": 1}
+    assert full_scans(db, sql, params) == []
+
+@pytest.mark.parametrize("filename", sorted(glob(os.path.join(reports_dir, "*.rpt"))))
+def test_report(db, filename):
+    assert full_scans(db, Report(filename).sql) == []
@@ -0,0 +1,83 @@
+"""Check that reports run with a row limit still fill the cache, and
+that later pages are answered from it"""
+
+from contextlib import contextmanager
+from sqlite3 import connect
+
+import inventory
+from test_paging import make_items
+
+sql = "select i.id, i.item from item i order by i.id"
+
+def count_items(db):
+    return db.conn.execute("select count(*) from item").fetchone()[0]
+
+def test_limited_run_fills_cache(db):
+    db.add_inventory_many(make_items(1200))
+    total = count_items(db)
+
+    first = [row for _, rows in db.iter_report(sql, 500, 1001, 0)
+             for row in rows]
+    assert len(first) == 1001
+    assert sql in db._report_cache
+    assert len(db._report_cache[sql][2]) == total
+
+    # a later page comes from the cache, not the query
+    def fail(*args):
+        raise AssertionError("report ran again")
+    db.read_pool.connection = fail
+
+    rest = [row for _, rows in db.iter_report(sql, 500, 1001, 1000)
+            for row in rows]
+    assert first[:1000] + rest == db._report_cache[sql][2]
+
+def counting_reads(db):
+    """Return a list of the IDs passed to counted() in reports on <db>,
+    which records each row the query reads"""
+    read = []
+    pool_connection = db.read_pool.connection
+
+    @contextmanager
+    def connection():
+        with pool_connection() as conn:
+            conn.create_function("counted", 1,
+                                 lambda id: read.append(id) or id)
+            yield conn
+
+    db.read_pool.connection = connection
+    return read
+
+def test_large_result_not_cached(db, monkeypatch):
+    cap = count_items(db) + 100
+    monkeypatch.setattr(inventory, "report_cache_max_rows", cap)
+    db.add_inventory_many(make_items(150))
+    read = counting_reads(db)
+    counted_sql = "select counted(i.id), i.item from item i order by i.id"
+
+    rows = [row for _, rows in db.iter_report(counted_sql, 50, 51, 0)
+            for row in rows]
+    assert len(rows) == 51
+    assert counted_sql not in db._report_cache
+
+    # reading stopped one row past the most that could be cached (and
+    # the sqlite3 module steps one row ahead)
+    assert len(read) == cap + 2
+
+    # and isn't tried again until the data changes
+    del read[:]
+    list(db.iter_report(counted_sql, 50, 20, 0))
+    assert len(read) == 21
+
+def test_cache_dropped_after_write(db):
+    db.add_inventory_many(make_items(10))
+    total = count_items(db)
+    list(db.iter_report(sql, 500, 5, 0))
+    assert sql in db._report_cache
+
+    other = connect(db.filename)
+    other.execute("delete from item where id = (select max(id) from item)")
+    other.commit()
+    other.close()
+
+    rows = [row for _, rows in db.iter_report(sql) for row in rows]
+    assert len(rows) == total - 1
@@ -0,0 +1,38 @@
+"""Check that measurements compare by the unit table of the file they
+came from"""
+
+from inventory import InventoryDB, Measurement
+
+def test_measurements_compare_across_units(db):
+    pound = Measurement(1, "pound", db.conversions)
+    ounces = Measurement(16, "ounce", db.conversions)
+
+    assert pound == ounces
+    assert Measurement(17, "ounce", db.conversions) > pound
+    assert pound.base_quantity() == ("ounce", 16)
+
+    # one side's conversions are enough
+    assert Measurement(16, "ounce") == pound
+
+def test_files_keep_their_own_conversions(db, tmp_path):
+    # a second file whose pound is 15 ounces
+    other = InventoryDB(str(tmp_path / "other.qm"))
+    try:
+        other.conn.execute("update unit set multiplier = 15 " +
+                           "where unit = 'pound'")
+        other.conn.commit()
+        other.close()
+        other = InventoryDB(str(tmp_path / "other.qm"))
+
+        assert (Measurement(1, "pound", other.conversions) ==
+                Measurement(15, "ounce", other.conversions))
+
+        # opening the second file doesn't change the first
+        assert (Measurement(1, "pound", db.conversions) ==
+                Measurement(16, "ounce", db.conversions))
+    finally:
+        other.close()
+
+def test_measurements_without_conversions_compare_by_unit():
+    assert Measurement(2, "pound") > Measurement(1, "pound")
+    assert Measurement(1, "pound") != Measurement(16, "ounce")
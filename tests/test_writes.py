@@ -0,0 +1,61 @@
+"""Check that writes which read the file first take the write lock
+before reading, so another program can't commit in between and make
+them fail"""
+
+from sqlite3 import connect, OperationalError
+
+import pytest
+
+from inventory import InventoryDB
+from test_paging import make_items
+
+@pytest.fixture
+def wal_db(tmp_path):
+    db = InventoryDB(str(tmp_path / "test.qm"), "performance")
+    yield db
+    db.close()
+
+def write_elsewhere(filename):
+    """Try to commit a change from another connection at once; return
+    whether it could"""
+    other = connect(filename, timeout=0)
+    try:
+        other.execute("insert into goal_scenario (name, multiplier) " +
+                      "values ('elsewhere', 1)")
+        other.commit()
+        return True
+    except OperationalError:
+        return False
+    finally:
+        other.close()
+
+def interrupt_first_read(db):
+    """Make another program try to commit just after <db> next runs a
+    SELECT, before its next statement"""
+    read = []
+    def trace(sql):
+        if read:
+            db.conn.set_trace_callback(None)
+            write_elsewhere(db.filename)
+        elif sql.lstrip().lower().startswith("select"):
+            read.append(sql)
+    db.conn.set_trace_callback(trace)
+
+def save(db, item):
+    item.description = "Rice"
+    db.save_inventory(item)
+
+def delete(db, item):
+    db.delete_item(item)
+
+def use_scenario(db, item):
+    db.use_scenario("family")
+
+@pytest.mark.parametrize("write", [save, delete, use_scenario])
+def test_outside_commit_after_read(wal_db, write):
+    item = make_items(1)[0]
+    wal_db.add_inventory(item)
+    wal_db.set_goals(4, "family")
+
+    interrupt_first_read(wal_db)
+    write(wal_db, item)